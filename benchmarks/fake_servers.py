@@ -0,0 +1,254 @@
+"""ベンチマーク用のローカルスタブサーバー（Spotify Web API と Qobuz）
+
+どちらも同じ決定的なカタログから応答を生成するので、実アカウントなしで
+取得・検索・同期の処理時間を測定できる。レイテンシと失敗率は起動時に指定する。
+"""
+import json
+import random
+import re
+import threading
+import time
+from html import escape
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+ARTIST_COUNT = 500
+SESSION_COOKIE = "qobuz_session=bench"
+AUTH_TOKEN = "bench-token"
+
+
+def catalog_track(index):
+    """カタログのindex番目のトラック（SpotifyとQobuzで共通）"""
+    return {
+        'index': index,
+        'spotify_id': f"bench{index:010d}",
+        'qobuz_id': str(100000 + index),
+        'name': f"Track {index}",
+        'artist': f"Artist {index % ARTIST_COUNT}",
+        'album': f"Album {index // 10}",
+        'duration': 180 + index % 120,
+        'isrc': f"BENCH{index:07d}",
+    }
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    """レイテンシと失敗の注入を共通で行うハンドラ"""
+    protocol_version = "HTTP/1.1"
+    # keep-alive接続でヘッダーと本文を別々に送るときの遅延ACK待ちを避ける
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body, content_type="application/json", headers=None):
+        data = body.encode("utf-8") if isinstance(body, str) else body
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in headers or ():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_json(self, payload, status=200):
+        self._send(status, json.dumps(payload))
+
+    def do_GET(self, body=""):
+        config = self.server.config
+        if config['latency']:
+            time.sleep(config['latency'])
+        if config['failure_rate'] and random.random() < config['failure_rate']:
+            self._send_json({'error': {'status': 503, 'message': "injected failure"}}, status=503)
+            return
+        url = urlparse(self.path)
+        params = {key: values[0] for key, values in parse_qs(url.query).items()}
+        params.update({key: values[0] for key, values in parse_qs(body).items()})
+        self.route(url.path, params)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        self.do_GET(self.rfile.read(length).decode("utf-8"))
+
+    def route(self, path, params):
+        raise NotImplementedError
+
+
+class FakeSpotifyHandler(_StubHandler):
+    """Spotify Web API のうちプレイリスト取得に使うエンドポイントだけを返す"""
+
+    def _item(self, index):
+        track = catalog_track(index)
+        return {'track': {
+            'id': track['spotify_id'],
+            'name': track['name'],
+            'duration_ms': track['duration'] * 1000,
+            'external_ids': {'isrc': track['isrc']},
+            'artists': [{'name': track['artist']}],
+            'album': {'name': track['album']},
+            'external_urls': {'spotify': f"https://open.spotify.com/track/{track['spotify_id']}"},
+        }}
+
+    def _page(self, offset, limit):
+        total = self.server.config['playlist_size']
+        items = [self._item(i) for i in range(offset, min(offset + limit, total))]
+        return {'items': items, 'total': total, 'offset': offset, 'limit': limit}
+
+    def route(self, path, params):
+        match = re.match(r"^/v1/playlists/([^/]+)(/tracks|/items)?$", path)
+        if not match:
+            self._send_json({'error': {'status': 404, 'message': "not found"}}, status=404)
+            return
+        if match.group(2):
+            self._send_json(self._page(int(params.get('offset', 0)), int(params.get('limit', 100))))
+        else:
+            self._send_json({
+                'id': match.group(1),
+                'name': f"Bench playlist ({self.server.config['playlist_size']})",
+                'snapshot_id': "bench-snapshot",
+                'tracks': self._page(0, 100),
+            })
+
+
+class FakeQobuzHandler(_StubHandler):
+    """Qobuzのログイン・検索・プレイリスト画面とJSON検索APIのスタンドイン"""
+
+    def _logged_in(self):
+        return SESSION_COOKIE in (self.headers.get("Cookie") or "")
+
+    def _html(self, body):
+        user_menu = '<div class="userMenu">bench user</div>' if self._logged_in() else ""
+        self._send(200, f"<!DOCTYPE html><html><body>{user_menu}{body}</body></html>", "text/html; charset=utf-8")
+
+    def _candidates(self, query):
+        """検索クエリに一致するトラックと、よくある紛らわしい候補を返す"""
+        size = self.server.config['catalog_size']
+        match = re.search(r"BENCH(\d{7})", query) or re.search(r"Track (\d+)", query)
+        if not match or int(match.group(1)) >= size:
+            return []
+        track = catalog_track(int(match.group(1)))
+        decoys = [
+            dict(track, qobuz_id=str(900000 + track['index']), name=f"{track['name']} (Live)", isrc=None,
+                 duration=track['duration'] + 25),
+            dict(track, qobuz_id=str(800000 + track['index']), name=f"{track['name']} (Karaoke Version)",
+                 artist="Karaoke Stars", isrc=None),
+        ]
+        return decoys[:1] + [track] + decoys[1:]
+
+    def route(self, path, params):
+        if path == "/api.json/0.2/track/search":
+            items = [{
+                'id': int(track['qobuz_id']),
+                'title': track['name'],
+                'duration': track['duration'],
+                'isrc': track['isrc'],
+                'performer': {'name': track['artist']},
+                'album': {'title': track['album'], 'artist': {'name': track['artist']}},
+            } for track in self._candidates(params.get('query', ""))]
+            self._send_json({'tracks': {'items': items, 'total': len(items)}})
+        elif path == "/api.json/0.2/playlist/addTracks":
+            # カタログにないIDを含むバッチは丸ごと拒否する（部分失敗の切り分けを確認するため）
+            if self.headers.get("X-User-Auth-Token") != AUTH_TOKEN:
+                self._send_json({'status': "error", 'code': 401, 'message': "auth required"}, status=401)
+                return
+            ids = [int(qobuz_id) for qobuz_id in params.get('track_ids', "").split(",") if qobuz_id]
+            size = self.server.config['catalog_size']
+            if not ids or any(not 100000 <= qobuz_id < 100000 + size for qobuz_id in ids):
+                self._send_json({'status': "error", 'code': 400, 'message': "invalid track id"}, status=400)
+                return
+            with self.server.lock:
+                playlist = self.server.playlists.setdefault(params.get('playlist_id', "1"), [])
+                playlist.extend(qobuz_id for qobuz_id in ids if qobuz_id not in playlist)
+                count = len(playlist)
+            self._send_json({'id': int(params.get('playlist_id', 0)), 'tracks_count': count})
+        elif path == "/api.json/0.2/playlist/getUserPlaylists":
+            with self.server.lock:
+                items = [{'id': int(playlist_id), 'name': f"Bench {playlist_id}", 'tracks_count': len(ids)}
+                         for playlist_id, ids in self.server.playlists.items()]
+            self._send_json({'playlists': {'items': items, 'total': len(items)}})
+        elif path == "/api.json/0.2/playlist/get":
+            offset, limit = int(params.get('offset', 0)), int(params.get('limit', 50))
+            with self.server.lock:
+                ids = list(self.server.playlists.get(params.get('playlist_id'), []))
+            items = []
+            for position, qobuz_id in enumerate(ids[offset:offset + limit], start=offset):
+                track = catalog_track(qobuz_id - 100000)
+                items.append({
+                    'id': qobuz_id, 'playlist_track_id': position + 1, 'title': track['name'],
+                    'duration': track['duration'], 'isrc': track['isrc'], 'performer': {'name': track['artist']},
+                    'album': {'title': track['album'], 'artist': {'name': track['artist']}},
+                })
+            self._send_json({'id': int(params.get('playlist_id', 0)), 'tracks': {'items': items, 'total': len(ids)}})
+        elif path == "/api.json/0.2/playlist/deleteTracks":
+            positions = {int(value) - 1 for value in params.get('playlist_track_ids', "").split(",") if value}
+            with self.server.lock:
+                ids = self.server.playlists.get(params.get('playlist_id'), [])
+                ids[:] = [qobuz_id for position, qobuz_id in enumerate(ids) if position not in positions]
+            self._send_json({'status': "success"})
+        elif path == "/signin":
+            self._html(
+                '<form action="/signin/submit" method="get">'
+                '<input id="email" name="email" type="email">'
+                '<input name="password" type="password">'
+                '<button type="submit">Log in</button></form>'
+            )
+        elif path == "/signin/submit":
+            self._send(302, "", "text/plain", headers=[
+                ("Location", "/"),
+                ("Set-Cookie", f"{SESSION_COOKIE}; Path=/"),
+                ("Set-Cookie", f"user_auth_token={AUTH_TOKEN}; Path=/"),
+            ])
+        elif path == "/search":
+            rows = "".join(
+                f'<div class="track-item" data-track-id="{track["qobuz_id"]}" data-title="{escape(track["name"])}"'
+                f' data-artist="{escape(track["artist"])}" data-album="{escape(track["album"])}"'
+                f' data-duration="{track["duration"]}">{escape(track["name"])}</div>'
+                for track in self._candidates(params.get('q', ""))
+            )
+            self._html(rows or '<div class="no-result">No results</div>')
+        elif path == "/my-profile/playlists":
+            # 保存ボタンを先に置く（「Create」を含む最初のボタンとして見つかるように）
+            with self.server.lock:
+                links = "".join(f'<a href="/playlist/{playlist_id}">Bench {playlist_id}</a>'
+                                for playlist_id in self.server.playlists)
+            self._html(
+                '<div id="new-playlist" style="display:none">'
+                '<input placeholder="Playlist name">'
+                '<button onclick="location.href=\'/playlist/1\'">Create</button></div>'
+                '<button onclick="document.getElementById(\'new-playlist\').style.display=\'block\'">'
+                f'Create a playlist</button><div class="my-playlists">{links}</div>'
+            )
+        else:
+            self._html(f"<h1>{escape(path)}</h1>")
+
+
+class StubServer:
+    """スタブサーバーを別スレッドで起動する（with文で使う）"""
+
+    def __init__(self, handler, **config):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        self.server.daemon_threads = True
+        self.server.config = {'latency': 0.0, 'failure_rate': 0.0, **config}
+        # プレイリストID → Qobuz IDのリスト（一括追加・削除のAPIで更新される）
+        self.server.playlists = {}
+        self.server.lock = threading.Lock()
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server.server_port}"
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def fake_spotify(playlist_size, latency=0.0, failure_rate=0.0):
+    return StubServer(FakeSpotifyHandler, playlist_size=playlist_size, latency=latency, failure_rate=failure_rate)
+
+
+def fake_qobuz(catalog_size, latency=0.0, failure_rate=0.0):
+    return StubServer(FakeQobuzHandler, catalog_size=catalog_size, latency=latency, failure_rate=failure_rate)
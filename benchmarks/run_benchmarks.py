@@ -0,0 +1,201 @@
+"""オフラインのベンチマーク（ローカルのスタブサーバーに対して同期処理を実行する）
+
+使い方:
+    python benchmarks/run_benchmarks.py                 # ブラウザ不要のシナリオをすべて実行
+    python benchmarks/run_benchmarks.py fetch-1k sync-10  # シナリオを指定して実行
+    python benchmarks/run_benchmarks.py --list          # シナリオ一覧
+    python benchmarks/run_benchmarks.py --output bench.json
+
+各シナリオは別プロセスで実行し、曲数/秒・経過時間・最大RSSを計測する。
+sync-* のシナリオはChromeが必要で、見つからない場合はスキップする。
+"""
+import argparse
+import json
+import logging
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+PLAYLIST_ID = "benchplaylist"
+
+# kind: fetch = get_playlist_tracks のみ
+#       resolve = 取得 + APIバックエンドでの検索・マッチング（ブラウザ不要）
+#       export = resolve_only でマッチングだけを行い、結果をJSONに書き出す（ブラウザ不要）
+#       sync = sync_to_qobuz をChromeで最後まで実行
+SCENARIOS = {
+    'fetch-10': dict(kind="fetch", size=10),
+    'fetch-1k': dict(kind="fetch", size=1000),
+    'fetch-10k': dict(kind="fetch", size=10000),
+    'fetch-1k-latency': dict(kind="fetch", size=1000, latency=0.05),
+    'fetch-1k-failures': dict(kind="fetch", size=1000, failure_rate=0.05),
+    'resolve-10': dict(kind="resolve", size=10),
+    'resolve-1k': dict(kind="resolve", size=1000, workers=4),
+    'resolve-10k': dict(kind="resolve", size=10000, workers=8),
+    'resolve-1k-latency': dict(kind="resolve", size=1000, latency=0.02, workers=8),
+    'resolve-1k-failures': dict(kind="resolve", size=1000, failure_rate=0.05, workers=4),
+    'export-1k': dict(kind="export", size=1000, workers=4),
+    'sync-10': dict(kind="sync", size=10, backend="selenium"),
+    'sync-10-api': dict(kind="sync", size=10, backend="api"),
+    'sync-10-api-lean': dict(kind="sync", size=10, backend="api", lean=True),
+    'sync-1k-api': dict(kind="sync", size=1000, backend="api", workers=2),
+    'sync-10k-api': dict(kind="sync", size=10000, backend="api", workers=4, lean=True),
+}
+
+CHROME_BINARIES = ("google-chrome", "google-chrome-stable", "chromium", "chromium-browser", "chrome")
+
+
+def chrome_available():
+    return any(shutil.which(name) for name in CHROME_BINARIES)
+
+
+def peak_rss_mb():
+    """このプロセスと終了済みの子プロセスの最大RSS（MB）"""
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale
+    return round(own, 1), round(children, 1)
+
+
+def run_scenario(name, verbose=False):
+    """シナリオを1つ実行して結果を辞書で返す（子プロセス内で呼ばれる）"""
+    sys.path.insert(0, BENCH_DIR)
+    sys.path.insert(0, REPO_DIR)
+    from fake_servers import catalog_track, fake_qobuz, fake_spotify
+
+    scenario = {'latency': 0.0, 'failure_rate': 0.0, 'workers': 1, 'backend': "api", 'lean': False,
+                **SCENARIOS[name]}
+    size = scenario['size']
+    workdir = tempfile.mkdtemp(prefix="qobuz_bench_")
+    os.chdir(workdir)
+
+    with fake_spotify(size, scenario['latency'], scenario['failure_rate']) as spotify_stub, \
+            fake_qobuz(size, scenario['latency'], scenario['failure_rate']) as qobuz_stub:
+        # sync_playlistsはインポート時にURLとレート制限を読むので、その前に設定する
+        os.environ.update({
+            'QOBUZ_BASE_URL': qobuz_stub.url,
+            'QOBUZ_REQUESTS_PER_SECOND': "100000",
+            'QOBUZ_API_REQUESTS_PER_SECOND': "100000",
+            'QOBUZ_APP_ID': "bench-app",
+            'CI': "1",
+            'QOBUZ_LEAN_BROWSER': "1" if scenario['lean'] else "0",
+        })
+        import spotipy
+        import_start = time.perf_counter()
+        import sync_playlists
+        import_time = time.perf_counter() - import_start
+        logging.getLogger().setLevel(logging.INFO if verbose else logging.ERROR)
+
+        sp = spotipy.Spotify(auth="bench-token", requests_timeout=10)
+        sp.prefix = f"{spotify_stub.url}/v1/"
+        result = {'scenario': name, **scenario}
+
+        start = time.perf_counter()
+        if scenario['kind'] == "fetch":
+            tracks = sync_playlists.get_playlist_tracks(sp, PLAYLIST_ID)
+            processed = len(tracks)
+        elif scenario['kind'] == "resolve":
+            backend = sync_playlists.QobuzApiSearchBackend("bench-app", base_url=f"{qobuz_stub.url}/api.json/0.2",
+                                                           pool_size=scenario['workers'])
+            limiter = sync_playlists.RateLimiter(rate=100000, burst=scenario['workers'], jitter=0)
+
+            def resolve(indexed):
+                index, track = indexed
+                best, _, tier = sync_playlists.resolve_track(backend, track, rate_limiter=limiter)
+                return best is not None and best['qobuz_id'] == catalog_track(index)['qobuz_id'], tier
+
+            tracks = sync_playlists.iter_playlist_tracks(sp, PLAYLIST_ID)
+            with ThreadPoolExecutor(max_workers=scenario['workers']) as executor:
+                outcomes = list(executor.map(resolve, enumerate(tracks)))
+            processed = len(outcomes)
+            result['correct_matches'] = sum(1 for correct, _ in outcomes if correct)
+            result['tiers'] = {}
+            for _, tier in outcomes:
+                result['tiers'][tier or "none"] = result['tiers'].get(tier or "none", 0) + 1
+        elif scenario['kind'] == "export":
+            search_backend = sync_playlists.create_search_backend("api")
+            tracks = sync_playlists.iter_playlist_tracks(sp, PLAYLIST_ID)
+            rows = sync_playlists.resolve_only(tracks, search_backend=search_backend, workers=scenario['workers'])
+            sync_playlists.write_mapping_export(rows, "qobuz_mapping.json", playlist_id=PLAYLIST_ID)
+            processed = len(rows)
+            result['correct_matches'] = sum(1 for row in rows if row['qobuz_id'] == catalog_track(row['position'])['qobuz_id'])
+            result['selenium_loaded'] = "selenium" in sys.modules
+        else:
+            search_backend = sync_playlists.create_search_backend(scenario['backend'])
+            tracks = sync_playlists.iter_playlist_tracks(sp, PLAYLIST_ID)
+            result['success'] = sync_playlists.sync_to_qobuz(
+                tracks, "bench@example.com", "bench-password",
+                workers=scenario['workers'], search_backend=search_backend,
+            )
+            processed = sync_playlists.run_metrics.report()['tracks']
+        wall_time = time.perf_counter() - start
+
+    own_rss, children_rss = peak_rss_mb()
+    result.update({
+        'tracks': processed,
+        'wall_time': round(wall_time, 3),
+        'tracks_per_second': round(processed / wall_time, 2) if wall_time > 0 else 0.0,
+        'import_time': round(import_time, 3),
+        'peak_rss_mb': own_rss,
+        'peak_children_rss_mb': children_rss,
+        'phases': sync_playlists.run_metrics.report()['phases'],
+    })
+    shutil.rmtree(workdir, ignore_errors=True)
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Spotify→Qobuz同期のオフラインベンチマーク")
+    parser.add_argument("scenarios", nargs="*", help="実行するシナリオ（省略時はブラウザ不要のものすべて）")
+    parser.add_argument("--list", action="store_true", help="シナリオ一覧を表示する")
+    parser.add_argument("--output", help="結果をJSONで保存するファイル")
+    parser.add_argument("--verbose", action="store_true", help="同期処理のログを表示する")
+    parser.add_argument("--run-one", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.run_one:
+        print(json.dumps(run_scenario(args.run_one, args.verbose)))
+        return 0
+    if args.list:
+        for name, scenario in SCENARIOS.items():
+            print(f"{name:22} {scenario}")
+        return 0
+
+    names = args.scenarios or [name for name, scenario in SCENARIOS.items() if scenario['kind'] != "sync"]
+    unknown = [name for name in names if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"不明なシナリオ: {', '.join(unknown)}")
+
+    results = []
+    print(f"{'scenario':22} {'tracks':>7} {'wall(s)':>9} {'tracks/s':>10} {'rss(MB)':>8}")
+    for name in names:
+        if SCENARIOS[name]['kind'] == "sync" and not chrome_available():
+            print(f"{name:22} skipped (Chrome not found)")
+            continue
+        command = [sys.executable, os.path.abspath(__file__), "--run-one", name]
+        if args.verbose:
+            command.append("--verbose")
+        completed = subprocess.run(command, stdout=subprocess.PIPE, text=True)
+        if completed.returncode != 0 or not completed.stdout.strip():
+            print(f"{name:22} failed (exit {completed.returncode})")
+            continue
+        result = json.loads(completed.stdout.strip().splitlines()[-1])
+        results.append(result)
+        rss = max(result['peak_rss_mb'], result['peak_children_rss_mb'])
+        print(f"{name:22} {result['tracks']:>7} {result['wall_time']:>9.2f} "
+              f"{result['tracks_per_second']:>10.1f} {rss:>8.1f}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
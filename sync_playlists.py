@@ -1,16 +1,50 @@
 import os
+import sys
 import time
 import logging
 import random
 import pickle
+import shutil
+import itertools
+import json
+import csv
+import bisect
+import argparse
+import sqlite3
+import queue
+import threading
+import re
+import unicodedata
+import functools
+import multiprocessing
+from contextlib import contextmanager
+from collections import deque, OrderedDict
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+import requests
+from requests.adapters import HTTPAdapter
+from urllib.parse import quote_plus
 import spotipy
 from spotipy.oauth2 import SpotifyOAuth
-from selenium import webdriver
-from selenium.webdriver.chrome.service import Service
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from webdriver_manager.chrome import ChromeDriverManager
+
+# Seleniumとwebdriver_managerは読み込みに時間がかかるので、ブラウザを起動するときに
+# _load_selenium で読み込む（ブラウザを使わない処理では読み込まない）
+webdriver = Service = By = ActionChains = WebDriverWait = EC = ChromeDriverManager = None
+
+def _load_selenium():
+    """Selenium関連のモジュールを読み込み、モジュール全体で使えるようにする"""
+    global webdriver, Service, By, ActionChains, WebDriverWait, EC, ChromeDriverManager
+    if webdriver is not None:
+        return
+    from selenium import webdriver as selenium_webdriver
+    from selenium.webdriver.chrome.service import Service as ChromeService
+    from selenium.webdriver.common.by import By as SeleniumBy
+    from selenium.webdriver.common.action_chains import ActionChains as SeleniumActionChains
+    from selenium.webdriver.support.ui import WebDriverWait as SeleniumWebDriverWait
+    from selenium.webdriver.support import expected_conditions
+    from webdriver_manager.chrome import ChromeDriverManager as DriverManager
+    Service, By, ActionChains = ChromeService, SeleniumBy, SeleniumActionChains
+    WebDriverWait, EC, ChromeDriverManager = SeleniumWebDriverWait, expected_conditions, DriverManager
+    webdriver = selenium_webdriver
 
 # ロギング設定
 logging.basicConfig(
@@ -18,7 +52,210 @@ logging.basicConfig(
     format='%(asctime)s - %(levelname)s - %(message)s'
 )
 
+# QobuzのURL（環境変数 QOBUZ_BASE_URL でローカルのスタブサーバーに差し替えられる）
+QOBUZ_BASE_URL = os.environ.get("QOBUZ_BASE_URL", "https://www.qobuz.com").rstrip("/")
+
+# 計測（フェーズごとの処理時間とカウンター）
+class RunMetrics:
+    """フェーズごとの処理時間とイベント数を集計する（スレッドセーフ）"""
+
+    def __init__(self):
+        self.started_at = time.time()
+        self._started = time.perf_counter()
+        self._spans = {}
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def span(self, name):
+        """with文で囲んだ区間の処理時間を記録する"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self._spans.setdefault(name, []).append(elapsed)
+
+    def timed(self, name=None):
+        """関数全体の処理時間を記録するデコレータ"""
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.span(name or func.__name__):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def reset(self):
+        """集計を最初からやり直す（子プロセスで親の集計を引き継がないように）"""
+        with self._lock:
+            self.started_at = time.time()
+            self._started = time.perf_counter()
+            self._spans = {}
+            self._counters = {}
+
+    def incr(self, name, amount=1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + amount
+
+    @staticmethod
+    def _percentile(sorted_values, pct):
+        if not sorted_values:
+            return 0.0
+        position = (len(sorted_values) - 1) * pct / 100
+        lower = int(position)
+        upper = min(lower + 1, len(sorted_values) - 1)
+        return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+    def report(self):
+        """集計結果を辞書で返す"""
+        wall_time = time.perf_counter() - self._started
+        with self._lock:
+            spans = {name: sorted(values) for name, values in self._spans.items()}
+            counters = dict(self._counters)
+        phases = {}
+        for name, values in spans.items():
+            phases[name] = {
+                'count': len(values),
+                'total': round(sum(values), 4),
+                'mean': round(sum(values) / len(values), 4),
+                'p50': round(self._percentile(values, 50), 4),
+                'p95': round(self._percentile(values, 95), 4),
+                'max': round(values[-1], 4),
+            }
+        tracks = phases.get('track', {}).get('count', 0)
+        return {
+            'started_at': time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.started_at)),
+            'wall_time': round(wall_time, 3),
+            'tracks': tracks,
+            'tracks_per_second': round(tracks / wall_time, 4) if wall_time > 0 else 0.0,
+            'phases': phases,
+            'counters': counters,
+        }
+
+    def write_report(self, path, extra=None):
+        """集計結果をJSONファイルに書き出す（extraの項目を追加できる）"""
+        try:
+            report = {**self.report(), **(extra or {})}
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+            logging.info(f"実行レポートを保存しました: {path} ({report['tracks_per_second']}曲/秒)")
+            return True
+        except Exception as e:
+            logging.error(f"実行レポートの保存中にエラー: {str(e)}")
+            return False
+
+run_metrics = RunMetrics()
+RUN_REPORT_FILE = "sync_report.json"
+
+# デバッグ用の記録（直近のページ状態をメモリに保持し、エラー時だけ書き出す）
+DEBUG_ARTIFACTS_DIR = "debug_artifacts"
+
+def _safe_filename(label, max_length=80):
+    """ファイル名に使えない文字を置き換え、長さを制限する"""
+    name = re.sub(r"[^\w.-]+", "_", label, flags=re.UNICODE).strip("._")
+    return name[:max_length] or "page"
+
+class DebugArtifacts:
+    """直近N件のページ状態を保持するリングバッファ
+
+    通常時は区間名・時刻とページのURL・タイトルだけを記録する（画面は取得しない）。
+    verboseの場合は毎回スクリーンショットを取り、バックグラウンドで書き出す。
+    エラー時はその時点の画面とページソースを取得し、バッファの内容と合わせて書き出す。
+    """
+
+    def __init__(self, directory=DEBUG_ARTIFACTS_DIR, capacity=20, verbose=False):
+        self.directory = directory
+        self.verbose = verbose
+        self._buffer = deque(maxlen=capacity)
+        self._sequence = itertools.count(1)
+        self._lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._writer = None
+
+    def _record(self, label, browser=None, screenshot=False, with_source=False):
+        entry = {'seq': next(self._sequence), 'time': time.time(), 'label': label,
+                 'thread': threading.current_thread().name}
+        if browser is not None:
+            try:
+                entry['url'] = browser.current_url
+                entry['title'] = browser.title
+                if screenshot:
+                    entry['png'] = browser.get_screenshot_as_png()
+                if with_source:
+                    entry['source'] = browser.page_source
+            except Exception as e:
+                entry['capture_error'] = str(e)
+        with self._lock:
+            self._buffer.append(entry)
+        return entry
+
+    def checkpoint(self, browser, label, with_source=False):
+        """処理の区切りを記録する（verboseの場合のみ画面を取得して書き出す）"""
+        if self.verbose:
+            self._enqueue([self._record(label, browser, screenshot=True, with_source=with_source)])
+        else:
+            self._record(label, browser)
+
+    def capture_error(self, browser, label):
+        """エラー時の画面とページソースを取得し、バッファの内容と合わせて書き出す"""
+        self._record(label, browser, screenshot=True, with_source=True)
+        with self._lock:
+            entries = list(self._buffer)
+            self._buffer.clear()
+        self._enqueue(entries, trail=label)
+
+    def _enqueue(self, entries, trail=None):
+        with self._lock:
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._write_loop, name="debug-artifacts", daemon=True)
+                self._writer.start()
+        self._queue.put((entries, trail))
+
+    def _write_loop(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            try:
+                self._write(*item)
+            except Exception as e:
+                logging.error(f"デバッグ情報の書き出し中にエラー: {str(e)}")
+            finally:
+                self._queue.task_done()
+
+    def _write(self, entries, trail):
+        os.makedirs(self.directory, exist_ok=True)
+        for entry in entries:
+            base = os.path.join(self.directory, f"{entry['seq']:05d}_{_safe_filename(entry['label'])}")
+            if entry.get('png'):
+                with open(f"{base}.png", "wb") as f:
+                    f.write(entry['png'])
+            if entry.get('source'):
+                with open(f"{base}.html", "w", encoding="utf-8") as f:
+                    f.write(entry['source'])
+        if trail:
+            path = os.path.join(self.directory, f"{entries[-1]['seq']:05d}_{_safe_filename(trail)}_trail.log")
+            with open(path, "w", encoding="utf-8") as f:
+                for entry in entries:
+                    stamp = time.strftime("%H:%M:%S", time.localtime(entry['time']))
+                    f.write(f"{stamp} #{entry['seq']} [{entry['thread']}] {entry['label']} {entry.get('url', '')}"
+                            f"{' (' + entry['title'] + ')' if entry.get('title') else ''}"
+                            f"{' ' + entry['capture_error'] if entry.get('capture_error') else ''}\n")
+            logging.info(f"デバッグ情報を書き出しました: {path}")
+
+    def close(self):
+        """書き出し待ちの内容をすべて書き出す"""
+        if self._writer is not None:
+            self._queue.put(None)
+            self._writer.join()
+            self._writer = None
+
+debug_artifacts = DebugArtifacts(directory=os.environ.get("QOBUZ_DEBUG_DIR", DEBUG_ARTIFACTS_DIR))
+
 # Spotifyの認証
+@run_metrics.timed()
 def authenticate_spotify():
     try:
         client_id = os.environ.get("SPOTIFY_CLIENT_ID")
@@ -53,48 +290,571 @@ def authenticate_spotify():
         logging.error(f"予期せぬ認証エラー: {str(e)}")
         return None
 
+# プレイリスト取得で要求するフィールド（使用するものだけに絞る）
+PLAYLIST_PAGE_SIZE = 100
+PLAYLIST_ITEM_FIELDS = "items(track(id,name,duration_ms,external_ids(isrc),artists(name),album(name),external_urls(spotify))),total"
+PLAYLIST_FIELDS = f"name,tracks({PLAYLIST_ITEM_FIELDS})"
+
+def _build_track_info(track):
+    """SpotifyのトラックオブジェクトをQobuz同期用の辞書に変換"""
+    artists = ", ".join([artist['name'] for artist in track['artists']])
+    return {
+        'id': track.get('id'),
+        'name': track['name'],
+        'artist': artists,
+        'album': track['album']['name'],
+        'duration_ms': track.get('duration_ms'),
+        'isrc': (track.get('external_ids') or {}).get('isrc'),
+        'url': track['external_urls']['spotify'] if 'external_urls' in track and 'spotify' in track['external_urls'] else None
+    }
+
+@run_metrics.timed("spotify_page")
+def _fetch_playlist_page(sp, playlist_id, offset, page_size=PLAYLIST_PAGE_SIZE):
+    """プレイリストの1ページ分のアイテムを取得"""
+    return sp.playlist_items(
+        playlist_id,
+        fields=PLAYLIST_ITEM_FIELDS,
+        limit=page_size,
+        offset=offset,
+        additional_types=("track",)
+    )
+
+# プレイリストからトラック情報をページ単位で逐次取得
+def iter_playlist_tracks(sp, playlist_id, page_size=PLAYLIST_PAGE_SIZE, max_workers=4):
+    """プレイリストのトラックを逐次yieldするジェネレータ
+
+    最初のページで総曲数を確認し、残りのページはスレッドプールで並行取得する。
+    先読みするページ数は max_workers * 2 までに制限し、メモリ使用量を抑える。
+    """
+    logging.info(f"プレイリスト {playlist_id} のトラック情報を取得開始")
+    results = sp.playlist(playlist_id, fields=PLAYLIST_FIELDS, additional_types=("track",))
+
+    playlist_name = results['name']
+    first_page = results['tracks']
+    total_tracks = first_page.get('total', len(first_page['items']))
+    logging.info(f"プレイリスト名: {playlist_name}, 曲数: {total_tracks}")
+
+    def tracks_in(page):
+        for item in page['items']:
+            track = item.get('track')
+            if track:
+                yield _build_track_info(track)
+
+    # 2ページ目以降のoffset（最初のページが空ならそれ以上は取得しない）
+    first_count = len(first_page['items'])
+    offsets = iter(range(first_count, total_tracks, page_size) if first_count else ())
+
+    yielded = 0
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pending = deque()
+
+        def submit_next():
+            offset = next(offsets, None)
+            if offset is not None:
+                pending.append((offset, executor.submit(_fetch_playlist_page, sp, playlist_id, offset, page_size)))
+
+        # 最初のページを処理している間に2ページ目以降の取得を始める
+        for _ in range(max_workers * 2):
+            submit_next()
+
+        for track in tracks_in(first_page):
+            yielded += 1
+            yield track
+
+        # 取得順ではなくプレイリスト順でyieldする
+        while pending:
+            offset, future = pending.popleft()
+            page = future.result()
+            submit_next()
+            logging.info(f"ページ取得完了: offset={offset}, {len(page['items'])}件")
+            for track in tracks_in(page):
+                yielded += 1
+                yield track
+
+    logging.info(f"{yielded}曲の情報を取得しました")
+
 # プレイリストからトラック情報を取得
-def get_playlist_tracks(sp, playlist_id):
+def get_playlist_tracks(sp, playlist_id, page_size=PLAYLIST_PAGE_SIZE, max_workers=4):
+    """プレイリストの全トラックをリストとして取得（失敗時はNone）"""
     try:
-        logging.info(f"プレイリスト {playlist_id} のトラック情報を取得開始")
-        results = sp.playlist(playlist_id)
-        
-        playlist_name = results['name']
-        tracks_items = results['tracks']['items']
-        total_tracks = len(tracks_items)
-        
-        logging.info(f"プレイリスト名: {playlist_name}, 曲数: {total_tracks}")
-        
-        track_info = []
-        for item in tracks_items:
-            track = item['track']
-            if track:
-                artists = ", ".join([artist['name'] for artist in track['artists']])
-                track_info.append({
-                    'name': track['name'],
-                    'artist': artists,
-                    'album': track['album']['name'],
-                    'url': track['external_urls']['spotify'] if 'external_urls' in track and 'spotify' in track['external_urls'] else None
-                })
-        
-        logging.info(f"{len(track_info)}曲の情報を取得しました")
-        return track_info
+        return list(iter_playlist_tracks(sp, playlist_id, page_size=page_size, max_workers=max_workers))
     except Exception as e:
         logging.error(f"プレイリストトラック取得エラー: {str(e)}")
-        return []
+        return None
+
+# Spotify→Qobuzのマッチ結果キャッシュ
+MATCH_CACHE_FILE = "qobuz_match_cache.sqlite3"
+MATCH_CACHE_TTL = 30 * 24 * 3600  # 30日
+MATCH_CACHE_MAX_ENTRIES = 50000
+MATCH_CACHE_FLUSH_INTERVAL = 200  # 参照時刻の更新をまとめて書き込む件数
+
+def _track_cache_key(track):
+    """キャッシュのキー（SpotifyトラックID、なければURL）"""
+    return track.get('id') or track.get('url')
+
+class MatchCache:
+    """SQLiteに永続化するマッチキャッシュ（メモリ上のLRUを前段に持つ）
+
+    エントリはTTLを過ぎると無効になり、件数が上限を超えると
+    最終参照が古いものから削除する。複数スレッドから利用できる。
+    """
+
+    def __init__(self, path=MATCH_CACHE_FILE, ttl=MATCH_CACHE_TTL,
+                 max_entries=MATCH_CACHE_MAX_ENTRIES, memory_size=1024):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.memory_size = memory_size
+        self.hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._writes_since_evict = 0
+        # 参照時刻の更新と期限切れの削除は溜めておき、まとめて書き込む
+        self._pending_touch = {}
+        self._pending_delete = set()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS matches ("
+            " spotify_key TEXT PRIMARY KEY,"
+            " qobuz_id TEXT NOT NULL,"
+            " confidence REAL NOT NULL,"
+            " matched_at REAL NOT NULL,"
+            " last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_matches_last_used ON matches(last_used)")
+        self._conn.commit()
+
+    def _remember(self, key, entry):
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+
+    def get(self, key):
+        """キャッシュを参照する。期限切れ・未登録の場合はNone"""
+        if not key:
+            return None
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is None:
+                row = self._conn.execute(
+                    "SELECT qobuz_id, confidence, matched_at FROM matches WHERE spotify_key = ?", (key,)
+                ).fetchone()
+                if row:
+                    entry = {'qobuz_id': row[0], 'confidence': row[1], 'matched_at': row[2]}
+            if entry is None or now - entry['matched_at'] > self.ttl:
+                if entry is not None:
+                    self._memory.pop(key, None)
+                    self._pending_touch.pop(key, None)
+                    self._pending_delete.add(key)
+                    self._flush_pending_if_needed()
+                self.misses += 1
+                return None
+            self._remember(key, entry)
+            self._pending_touch[key] = now
+            self._flush_pending_if_needed()
+            self.hits += 1
+            return dict(entry)
+
+    def _flush_pending_if_needed(self):
+        if len(self._pending_touch) + len(self._pending_delete) >= MATCH_CACHE_FLUSH_INTERVAL:
+            self._flush_pending()
+            self._conn.commit()
+
+    def _flush_pending(self):
+        """溜めておいた参照時刻の更新と削除を書き込む（コミットは呼び出し側で行う）"""
+        if self._pending_touch:
+            self._conn.executemany(
+                "UPDATE matches SET last_used = ? WHERE spotify_key = ?",
+                [(used, key) for key, used in self._pending_touch.items()]
+            )
+            self._pending_touch.clear()
+        if self._pending_delete:
+            self._conn.executemany(
+                "DELETE FROM matches WHERE spotify_key = ?",
+                [(key,) for key in self._pending_delete]
+            )
+            self._pending_delete.clear()
+
+    def put(self, key, qobuz_id, confidence):
+        """マッチ結果を登録する"""
+        if not key or not qobuz_id:
+            return
+        now = time.time()
+        entry = {'qobuz_id': str(qobuz_id), 'confidence': float(confidence), 'matched_at': now}
+        with self._lock:
+            self._remember(key, entry)
+            self._pending_delete.discard(key)
+            self._pending_touch.pop(key, None)
+            self._conn.execute(
+                "INSERT OR REPLACE INTO matches (spotify_key, qobuz_id, confidence, matched_at, last_used)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (key, entry['qobuz_id'], entry['confidence'], now, now)
+            )
+            self._writes_since_evict += 1
+            # 件数チェックは一定間隔でまとめて行う
+            if self._writes_since_evict >= 100:
+                self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        self._writes_since_evict = 0
+        self._flush_pending()
+        self._conn.execute("DELETE FROM matches WHERE matched_at < ?", (time.time() - self.ttl,))
+        count = self._conn.execute("SELECT COUNT(*) FROM matches").fetchone()[0]
+        overflow = count - self.max_entries
+        if overflow > 0:
+            self._conn.execute(
+                "DELETE FROM matches WHERE spotify_key IN"
+                " (SELECT spotify_key FROM matches ORDER BY last_used ASC LIMIT ?)",
+                (overflow,)
+            )
+            logging.info(f"マッチキャッシュから{overflow}件を削除しました")
+
+    def close(self):
+        with self._lock:
+            self._evict()
+            self._conn.commit()
+            self._conn.close()
+        logging.info(f"マッチキャッシュ: ヒット {self.hits}件, ミス {self.misses}件")
+
+def open_match_cache(path=None):
+    """マッチキャッシュを開く。失敗した場合はキャッシュなしで続行する"""
+    path = path or os.environ.get("QOBUZ_MATCH_CACHE", MATCH_CACHE_FILE)
+    try:
+        cache = MatchCache(path)
+        logging.info(f"マッチキャッシュを開きました: {path}")
+        return cache
+    except Exception as e:
+        logging.error(f"マッチキャッシュを開けませんでした: {str(e)}")
+        return None
+
+# ペース制御（トークンバケット方式のレート制限と、ページ準備完了の待機）
+class ThrottledError(Exception):
+    """アクセス制限（429、CAPTCHAなど）を検出した"""
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class RateLimiter:
+    """ジッター付きトークンバケット（複数スレッドで共有できる）
+
+    アクセス制限を検出するとレートを半分に下げて一時停止し、
+    成功が続くと元のレートまで少しずつ戻す。空の検索結果が続く場合も制限とみなす。
+    """
+
+    def __init__(self, rate=0.5, burst=1, jitter=0.25, min_rate=0.05, empty_streak_limit=5):
+        self.max_rate = rate
+        self.rate = rate
+        self.burst = burst
+        self.jitter = jitter
+        self.min_rate = min_rate
+        self.empty_streak_limit = empty_streak_limit
+        self.throttle_count = 0
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._empty_streak = 0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """リクエスト1回分のトークンを取得するまで待機する"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if now >= self._paused_until and self._tokens >= 1:
+                    self._tokens -= 1
+                    break
+                wait = max(self._paused_until - now, (1 - self._tokens) / self.rate)
+            time.sleep(wait)
+        if self.jitter:
+            time.sleep(random.uniform(0, self.jitter / self.rate))
+
+    def report_success(self):
+        with self._lock:
+            self._empty_streak = 0
+            self.rate = min(self.max_rate, self.rate + self.max_rate * 0.05)
+
+    def report_empty(self):
+        with self._lock:
+            self._empty_streak += 1
+            throttled = self._empty_streak >= self.empty_streak_limit
+        if throttled:
+            self.report_throttled()
+
+    def report_throttled(self, retry_after=None):
+        with self._lock:
+            self._empty_streak = 0
+            self.throttle_count += 1
+            self.rate = max(self.min_rate, self.rate / 2)
+            pause = retry_after if retry_after else 1 / self.rate
+            self._paused_until = time.monotonic() + pause
+            self._tokens = 0.0
+        run_metrics.incr("throttled")
+        logging.warning(f"アクセス制限を検出しました: {pause:.1f}秒停止し、レートを{self.rate:.2f}回/秒に下げます")
+
+# 検索ページのレート制限（環境変数 QOBUZ_REQUESTS_PER_SECOND で変更可）
+search_rate_limiter = RateLimiter(rate=float(os.environ.get("QOBUZ_REQUESTS_PER_SECOND") or "0.5"))
+# 検索APIのレート制限（ページ読み込みより軽いので別に持つ。環境変数 QOBUZ_API_REQUESTS_PER_SECOND で変更可）
+api_rate_limiter = RateLimiter(rate=float(os.environ.get("QOBUZ_API_REQUESTS_PER_SECOND") or "5"), burst=4)
+
+def rate_limiter_for(backend):
+    """検索バックエンドに応じたレート制限を返す"""
+    return api_rate_limiter if getattr(backend, 'name', None) == "api" else search_rate_limiter
+
+# リトライ（エラーの分類、指数バックオフ、サーキットブレーカー）
+class AuthExpiredError(Exception):
+    """ログインや認証トークンの期限が切れている"""
+
+class ElementNotFoundError(Exception):
+    """ページ上に必要な要素が見つからない"""
+
+class CircuitOpenError(Exception):
+    """失敗が続いたため、これ以上の処理を打ち切る"""
+
+# 再試行すれば回復する可能性のあるエラーの種類
+TRANSIENT_ERRORS = ("network", "throttled")
+
+def classify_error(error):
+    """例外を throttled / auth / not_found / network / other のいずれかに分類する"""
+    if isinstance(error, ThrottledError):
+        return "throttled"
+    if isinstance(error, AuthExpiredError):
+        return "auth"
+    # Seleniumの例外はSeleniumを読み込んだ後にしか発生しない
+    selenium_errors = sys.modules.get("selenium.common.exceptions")
+    if isinstance(error, ElementNotFoundError):
+        return "not_found"
+    if selenium_errors and isinstance(error, (selenium_errors.NoSuchElementException,
+                                              selenium_errors.TimeoutException)):
+        return "not_found"
+    if isinstance(error, requests.HTTPError):
+        status = getattr(error.response, 'status_code', None) or 0
+        if status in (401, 403):
+            return "auth"
+        if status == 429:
+            return "throttled"
+        return "network" if status >= 500 else "other"
+    if isinstance(error, (requests.ConnectionError, requests.Timeout, ConnectionError, TimeoutError)):
+        return "network"
+    if selenium_errors and isinstance(error, selenium_errors.WebDriverException):
+        return "network"
+    return "other"
+
+class RetryEngine:
+    """エラーの種類に応じて再試行する（複数スレッドで共有できる）
+
+    待機時間はdecorrelated jitter付きの指数バックオフで決め、実行全体で待機に
+    使える時間（budget秒）を超えたら再試行しない。分類できたエラー（other以外）が
+    failure_threshold回続くとサーキットを開き、以降の呼び出しはCircuitOpenErrorで即座に失敗する。
+    reauthenticateを設定しておくと、認証エラーではサーキットを開く代わりに再ログインする。
+    """
+
+    def __init__(self, max_attempts=3, base_delay=1.0, max_delay=30.0, failure_threshold=8, budget=120.0):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.failure_threshold = failure_threshold
+        self.budget = budget
+        self.reauthenticate = None
+        self._opened = threading.Event()
+        self._spent = 0.0
+        self._consecutive_failures = 0
+        self._lock = threading.Lock()
+        self._auth_lock = threading.Lock()
+
+    @property
+    def circuit_open(self):
+        return self._opened.is_set()
+
+    def _record_success(self):
+        with self._lock:
+            self._consecutive_failures = 0
+
+    def _record_failure(self, kind):
+        """失敗を数え、サーキットを開くべきならTrueを返す"""
+        if kind == "other":
+            return False
+        with self._lock:
+            self._consecutive_failures += 1
+            if self._consecutive_failures < self.failure_threshold or self.circuit_open:
+                return self.circuit_open
+            if kind == "auth" and self.reauthenticate:
+                self._consecutive_failures = 0
+                return False
+            self._opened.set()
+        run_metrics.incr("circuit_open")
+        logging.error(f"失敗が{self.failure_threshold}回続いたため処理を打ち切ります (最後のエラー: {kind})")
+        return True
+
+    def _reserve(self, delay):
+        """リトライ予算から待機時間を確保する（足りなければFalse）"""
+        with self._lock:
+            if self._spent + delay > self.budget:
+                return False
+            self._spent += delay
+        return True
+
+    def _reauthenticate(self):
+        # 同時に失敗した他のスレッドは、先に始めた再ログインの完了を待つだけにする
+        if not self._auth_lock.acquire(blocking=False):
+            with self._auth_lock:
+                return
+        try:
+            logging.info("認証の期限切れを検出しました。再ログインします")
+            run_metrics.incr("reauthentications")
+            self.reauthenticate()
+        finally:
+            self._auth_lock.release()
+
+    def call(self, func, args=(), kwargs=None, max_attempts=None, base_delay=None, retryable=TRANSIENT_ERRORS):
+        """funcを実行し、retryableに含まれる種類のエラーなら待機してから再試行する"""
+        max_attempts = max_attempts or self.max_attempts
+        base_delay = base_delay or self.base_delay
+        delay = base_delay
+        reauthenticated = False
+        attempt = 0
+        while True:
+            attempt += 1
+            if self.circuit_open:
+                raise CircuitOpenError("失敗が続いたため処理を打ち切りました")
+            try:
+                result = func(*args, **(kwargs or {}))
+                self._record_success()
+                return result
+            except Exception as e:
+                kind = classify_error(e)
+                if self._record_failure(kind):
+                    raise CircuitOpenError(f"失敗が続いたため処理を打ち切りました: {str(e)}") from e
+                if kind == "auth" and self.reauthenticate and not reauthenticated:
+                    reauthenticated = True
+                    self._reauthenticate()
+                    # 再ログイン後の実行は試行回数に数えない（最後の試行で期限切れになっても再実行する）
+                    attempt -= 1
+                    continue
+                if kind not in retryable or attempt == max_attempts:
+                    raise
+                # decorrelated jitter: 直前の待機時間の3倍までの範囲でランダムに選ぶ
+                delay = min(self.max_delay, random.uniform(base_delay, delay * 3))
+                if kind == "throttled" and getattr(e, 'retry_after', None):
+                    delay = max(delay, e.retry_after)
+                if not self._reserve(delay):
+                    logging.warning(f"リトライ予算（{self.budget:.0f}秒）を使い切ったため再試行しません: {str(e)}")
+                    raise
+                run_metrics.incr("retries")
+                logging.warning(f"{kind}エラーのため{delay:.1f}秒後に再試行します ({attempt}/{max_attempts}): {str(e)}")
+                # 待機中に他のスレッドがサーキットを開いたらすぐに打ち切る
+                if self._opened.wait(delay):
+                    raise CircuitOpenError("失敗が続いたため処理を打ち切りました") from e
+
+retry_engine = RetryEngine(
+    failure_threshold=int(os.environ.get("QOBUZ_CIRCUIT_THRESHOLD") or "8"),
+    budget=float(os.environ.get("QOBUZ_RETRY_BUDGET") or "120"),
+)
+
+def wait_for_page_ready(browser, timeout=15):
+    """DOMの構築が終わるまで待機（画像などの読み込み完了は待たない）
+
+    必要な要素はこの後の条件待ちで確認するので、readyStateはinteractiveで十分。
+    """
+    WebDriverWait(browser, timeout).until(
+        lambda driver: driver.execute_script("return document.readyState") in ("interactive", "complete")
+    )
+
+def _page_has_captcha(browser):
+    return len(browser.find_elements(By.XPATH, "//iframe[contains(@src, 'captcha')] | //div[contains(@class, 'captcha')]")) > 0
+
+# ウォームスタート用の保存先（プロファイル、ドライバーのパス）
+WARM_START_DIR = os.environ.get("QOBUZ_WARM_START_DIR",
+                                os.path.join(os.path.expanduser("~"), ".cache", "spotify-qobuz-sync"))
+
+def _acquire_profile_dir(max_slots=16):
+    """再利用するプロファイルディレクトリをロックして確保する
+
+    ワーカーごとに別のスロット（slot0, slot1, ...）を使う。空きがない、または
+    ロックできない環境の場合は (None, None) を返す。
+    """
+    try:
+        import fcntl
+    except ImportError:
+        return None, None
+    profiles_dir = os.path.join(WARM_START_DIR, "profiles")
+    os.makedirs(profiles_dir, exist_ok=True)
+    for slot in range(max_slots):
+        lock_file = open(os.path.join(profiles_dir, f"slot{slot}.lock"), "w")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            continue
+        return os.path.join(profiles_dir, f"slot{slot}"), lock_file
+    return None, None
+
+def _cached_driver_path(refresh=False):
+    """ChromeDriverManagerでインストールしたドライバーのパスを再利用する"""
+    cache_file = os.path.join(WARM_START_DIR, "chromedriver_path")
+    if not refresh and os.path.exists(cache_file):
+        with open(cache_file, "r", encoding="utf-8") as f:
+            path = f.read().strip()
+        if path and os.access(path, os.X_OK):
+            logging.info(f"キャッシュ済みのドライバーを使用します: {path}")
+            return path
+    with run_metrics.span("driver_install"):
+        path = ChromeDriverManager().install()
+    os.makedirs(WARM_START_DIR, exist_ok=True)
+    with open(cache_file, "w", encoding="utf-8") as f:
+        f.write(path)
+    return path
+
+# 軽量モードで読み込みを止めるリソース（画像・フォント・メディア・計測タグ）
+LEAN_BLOCKED_URLS = [
+    "*.png", "*.jpg", "*.jpeg", "*.gif", "*.webp", "*.avif", "*.svg", "*.ico",
+    "*.woff", "*.woff2", "*.ttf", "*.otf", "*.eot",
+    "*.mp3", "*.mp4", "*.m4a", "*.aac", "*.ogg", "*.flac", "*.webm", "*.m3u8",
+    "*google-analytics.com*", "*googletagmanager.com*", "*doubleclick.net*", "*facebook.net*",
+    "*connect.facebook.com*", "*hotjar.com*", "*segment.io*", "*criteo.*", "*scorecardresearch.com*",
+    "*didomi.io*", "*sentry.io*", "*newrelic.com*", "*nr-data.net*",
+]
+
+def _env_flag(name):
+    return os.environ.get(name, "") not in ("", "0", "false")
 
 # ブラウザ設定（ボット検出回避対策強化版）
-def setup_browser():
-    """ボット検出対策を強化したブラウザの設定（改良版）"""
+@run_metrics.timed()
+def setup_browser(warm_start=None, lean=None):
+    """ボット検出対策を強化したブラウザの設定（改良版）
+
+    warm_start（省略時は環境変数 QOBUZ_WARM_START）が有効な場合は、ロックした
+    再利用プロファイルとキャッシュ済みのドライバーを使う。一時プロファイルは終了時に削除する。
+    lean（省略時は環境変数 QOBUZ_LEAN_BROWSER）が有効な場合は、画像・フォント・メディア・
+    計測タグの読み込みを止め、eagerで読み込み、レンダラーのメモリを制限する。
+    """
+    _load_selenium()
+    if warm_start is None:
+        warm_start = _env_flag("QOBUZ_WARM_START")
+    if lean is None:
+        lean = _env_flag("QOBUZ_LEAN_BROWSER")
+    profile_dir, profile_lock, temp_dir = None, None, None
     try:
         options = webdriver.ChromeOptions()
         
-        # 一意のユーザーデータディレクトリを指定または完全に無効化
-        import tempfile
-        import uuid
-        temp_dir = os.path.join(tempfile.gettempdir(), f"chrome_profile_{uuid.uuid4().hex}")
-        logging.info(f"一時ユーザーデータディレクトリを作成: {temp_dir}")
-        options.add_argument(f"--user-data-dir={temp_dir}")
+        # ウォームスタートでは再利用プロファイル、それ以外は一意の一時ディレクトリを使用
+        if warm_start:
+            profile_dir, profile_lock = _acquire_profile_dir()
+        if profile_dir:
+            logging.info(f"再利用プロファイルを使用します: {profile_dir}")
+            options.add_argument(f"--user-data-dir={profile_dir}")
+        else:
+            import tempfile
+            temp_dir = tempfile.mkdtemp(prefix="chrome_profile_")
+            logging.info(f"一時ユーザーデータディレクトリを作成: {temp_dir}")
+            options.add_argument(f"--user-data-dir={temp_dir}")
         
         # または、シークレットモードを使用してユーザーデータを保存しない方式にする
         # options.add_argument("--incognito")
@@ -114,6 +874,22 @@ def setup_browser():
         # ウィンドウサイズ設定
         options.add_argument("--window-size=1920,1080")
         
+        # 軽量モード: DOMの構築完了で読み込みを打ち切り、画像と不要なプロセス・メモリを抑える
+        if lean:
+            logging.info("軽量モード: 不要なリソースの読み込みを停止します")
+            options.page_load_strategy = "eager"
+            options.add_experimental_option("prefs", {
+                "profile.managed_default_content_settings.images": 2,
+                "profile.default_content_setting_values.notifications": 2,
+            })
+            options.add_argument("--blink-settings=imagesEnabled=false")
+            options.add_argument("--js-flags=--max-old-space-size=256")
+            options.add_argument("--renderer-process-limit=2")
+            options.add_argument("--disable-extensions")
+            options.add_argument("--disable-background-networking")
+            options.add_argument("--disable-component-update")
+            options.add_argument("--mute-audio")
+        
         # ボット検出対策の設定
         options.add_argument("--disable-blink-features=AutomationControlled")
         options.add_experimental_option("excludeSwitches", ["enable-automation"])
@@ -132,11 +908,38 @@ def setup_browser():
         if os.environ.get('CI'):
             logging.info("CI環境: 直接Chromeを使用します")
             driver = webdriver.Chrome(options=options)
+        elif warm_start:
+            logging.info("ローカル環境: キャッシュ済みのChromeDriverを使用します")
+            try:
+                driver = webdriver.Chrome(service=Service(_cached_driver_path()), options=options)
+            except Exception as e:
+                # Chromeの更新でドライバーが合わなくなった場合は入れ直す
+                logging.warning(f"キャッシュ済みのドライバーで起動できませんでした。再インストールします: {str(e)}")
+                driver = webdriver.Chrome(service=Service(_cached_driver_path(refresh=True)), options=options)
         else:
             logging.info("ローカル環境: ChromeDriverManagerを使用します")
-            service = Service(ChromeDriverManager().install())
+            with run_metrics.span("driver_install"):
+                driver_path = ChromeDriverManager().install()
+            service = Service(driver_path)
             driver = webdriver.Chrome(service=service, options=options)
         
+        # 終了時にプロファイルのロック解除・一時ディレクトリの削除を行う
+        original_quit = driver.quit
+        def quit_and_release():
+            try:
+                original_quit()
+            finally:
+                _release_profile(profile_lock, temp_dir)
+        driver.quit = quit_and_release
+        
+        # 軽量モード: DevToolsプロトコルでURLパターンごとにリクエストを遮断
+        if lean:
+            try:
+                driver.execute_cdp_cmd("Network.enable", {})
+                driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": LEAN_BLOCKED_URLS})
+            except Exception as e:
+                logging.warning(f"リソースの遮断を設定できませんでした: {str(e)}")
+        
         # webdriver検出を回避するJavaScript
         driver.execute_script("Object.defineProperty(navigator, 'webdriver', {get: () => undefined})")
         logging.info("ブラウザ設定完了")
@@ -144,53 +947,239 @@ def setup_browser():
         return driver
     except Exception as e:
         logging.error(f"ブラウザ設定エラー: {str(e)}")
+        _release_profile(profile_lock, temp_dir)
         raise
 
+def _release_profile(profile_lock, temp_dir):
+    if profile_lock:
+        profile_lock.close()
+    if temp_dir:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+# 要素の探索（前回見つかったセレクタを記憶し、候補はまとめて1回のスクリプト実行で調べる）
+SELECTOR_CACHE_FILE = "qobuz_selectors.json"
+
+# 論理的な要素ごとのセレクタ候補（上から順に優先。実際のQobuzのHTML構造に合わせて調整）
+# 種類はSeleniumのByの値と同じ文字列で書く（Seleniumを読み込まずに定義できるように）
+ELEMENT_SELECTORS = {
+    'login_email': [
+        ("id", "email"),
+        ("name", "email"),
+        ("name", "username"),
+        ("id", "username"),
+        ("css selector", "input[type='email']"),
+        ("xpath", "//form//input[contains(@placeholder, 'mail')]"),
+    ],
+    'login_password': [
+        ("xpath", "//input[@type='password']"),
+    ],
+    'login_submit': [
+        ("xpath", "//button[@type='submit']"),
+        ("xpath", "//form//button"),
+    ],
+    'user_menu': [
+        ("xpath", "//div[contains(@class, 'userMenu')]"),
+    ],
+    'create_playlist_button': [
+        ("xpath", "//button[contains(text(), 'Create a playlist')]"),
+    ],
+    'playlist_name_input': [
+        ("xpath", "//input[@placeholder='Playlist name']"),
+    ],
+    'playlist_save_button': [
+        ("xpath", "//button[contains(text(), 'Create')]"),
+    ],
+    'search_result': [
+        ("xpath", "//div[contains(@class, 'track-item')]"),
+    ],
+}
+
+# どの候補でも見つからない場合の汎用的なセレクタ（常に最後に調べ、記憶しない）
+ELEMENT_FALLBACK_SELECTORS = {
+    'login_email': [
+        ("xpath", "//form//input[1]"),  # フォームの最初のinput要素
+        ("tag name", "input"),  # ページの最初のinput要素
+    ],
+}
+
+# 候補を順に調べ、最初に見つかった候補の番号と要素を返す
+_PROBE_SELECTORS_SCRIPT = """
+const [candidates, clickable, many] = arguments;
+const usable = el => !clickable || (el.getClientRects().length > 0 && !el.disabled);
+for (let i = 0; i < candidates.length; i++) {
+    const [by, value] = candidates[i];
+    let found = [];
+    try {
+        if (by === 'xpath') {
+            const result = document.evaluate(value, document, null, XPathResult.ORDERED_NODE_SNAPSHOT_TYPE, null);
+            for (let j = 0; j < result.snapshotLength; j++) found.push(result.snapshotItem(j));
+        } else {
+            const css = by === 'id' ? '#' + CSS.escape(value)
+                : by === 'name' ? '[name="' + CSS.escape(value) + '"]' : value;
+            found = Array.from(document.querySelectorAll(css));
+        }
+    } catch (e) {
+        continue;
+    }
+    found = found.filter(usable);
+    if (found.length) return [i, many ? found : found.slice(0, 1)];
+}
+return null;
+"""
+
+class SelectorCache:
+    """論理的な要素ごとに、前回見つかったセレクタを記憶する
+
+    前回のセレクタを先頭にして全候補を1回のスクリプト実行で調べるので、
+    よくある場合はブラウザとの往復1回で要素が見つかる。
+    前回のセレクタで見つかればヒット、別の候補で見つかればミスとして数え、記憶を更新する。
+    汎用的なセレクタ（ELEMENT_FALLBACK_SELECTORS）は常に最後に調べ、見つかっても記憶しない。
+    """
+
+    def __init__(self, path=SELECTOR_CACHE_FILE):
+        self.path = path
+        self.stats = {'hits': 0, 'misses': 0, 'fallbacks': 0, 'not_found': 0}
+        self._lock = threading.Lock()
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                self._learned = {name: tuple(locator) for name, locator in json.load(f).items()}
+        except (OSError, ValueError):
+            self._learned = {}
+
+    def _save(self):
+        try:
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({name: list(locator) for name, locator in self._learned.items()}, f, indent=2)
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            logging.error(f"セレクタの保存中にエラー: {str(e)}")
+
+    def _count(self, key):
+        with self._lock:
+            self.stats[key] += 1
+        run_metrics.incr(f"selector_{key}")
+
+    def locate(self, browser, name, clickable=False, many=False):
+        """要素を待たずに1回だけ探す（見つからなければ空のリスト）"""
+        candidates = ELEMENT_SELECTORS[name]
+        learned = self._learned.get(name)
+        ordered = sorted(candidates, key=lambda locator: locator != learned)
+        ordered += ELEMENT_FALLBACK_SELECTORS.get(name, [])
+        result = browser.execute_script(_PROBE_SELECTORS_SCRIPT, [list(locator) for locator in ordered],
+                                        clickable, many)
+        if not result:
+            return []
+        index, elements = result
+        locator = ordered[index]
+        if locator == learned:
+            self._count('hits')
+        elif locator not in candidates:
+            self._count('fallbacks')
+            logging.warning(f"要素 {name} を汎用的なセレクタで見つけました: {locator[0]} = {locator[1]}")
+        else:
+            self._count('misses')
+            logging.info(f"要素 {name} のセレクタを記憶します: {locator[0]} = {locator[1]}")
+            with self._lock:
+                self._learned[name] = locator
+                self._save()
+        return elements
+
+    def find(self, browser, name, timeout=10, clickable=False):
+        """要素が現れるまで待って最初の1つを返す（見つからなければ例外）"""
+        try:
+            return WebDriverWait(browser, timeout, poll_frequency=0.2).until(
+                lambda driver: (self.locate(driver, name, clickable) or [None])[0]
+            )
+        except Exception:
+            self._count('not_found')
+            raise ElementNotFoundError(f"要素が見つかりませんでした: {name}")
+
+selector_cache = SelectorCache(os.environ.get("QOBUZ_SELECTOR_CACHE", SELECTOR_CACHE_FILE))
+
 # Cookie管理関数
-def save_cookies(browser, filename="qobuz_cookies.pkl"):
+COOKIE_FILE = "qobuz_cookies.json"
+LEGACY_COOKIE_FILE = "qobuz_cookies.pkl"
+
+def read_cookie_store(filename=COOKIE_FILE):
+    """保存済みのCookieから有効期限内のものだけを返す（ブラウザ不要）
+
+    JSONがなく旧形式（pickle）のファイルがある場合はそちらを読む。
+    """
+    try:
+        if os.path.exists(filename):
+            with open(filename, "r", encoding="utf-8") as f:
+                cookies = json.load(f).get('cookies', [])
+        elif filename == COOKIE_FILE and os.path.exists(LEGACY_COOKIE_FILE):
+            logging.info(f"旧形式のCookieファイルを読み込みます: {LEGACY_COOKIE_FILE}")
+            with open(LEGACY_COOKIE_FILE, "rb") as f:
+                cookies = pickle.load(f)
+        else:
+            return []
+    except Exception as e:
+        logging.error(f"Cookieファイルの読み込み中にエラー: {str(e)}")
+        return []
+    now = time.time()
+    valid = [cookie for cookie in cookies if not cookie.get('expiry') or cookie['expiry'] > now]
+    if len(valid) < len(cookies):
+        logging.info(f"期限切れのCookieを{len(cookies) - len(valid)}件除外しました")
+    return valid
+
+def save_cookies(browser, filename=COOKIE_FILE):
     """ブラウザのCookieを保存"""
     try:
-        pickle.dump(browser.get_cookies(), open(filename, "wb"))
+        tmp_path = f"{filename}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({'saved_at': time.time(), 'cookies': browser.get_cookies()}, f)
+        os.replace(tmp_path, filename)
         logging.info(f"Cookieを保存しました: {filename}")
         return True
     except Exception as e:
         logging.error(f"Cookie保存中にエラー: {str(e)}")
         return False
 
-def load_cookies(browser, filename="qobuz_cookies.pkl"):
-    """保存されたCookieをロード"""
+@run_metrics.timed()
+def load_cookies(browser, filename=COOKIE_FILE):
+    """保存されたCookieをロード
+
+    有効なCookieがない場合はページを開かずにFalseを返す。
+    再利用プロファイルで既にログイン済みの場合はCookieの注入を省略する。
+    """
     try:
-        if os.path.exists(filename):
-            logging.info(f"既存のCookieファイルを読み込みます: {filename}")
-            cookies = pickle.load(open(filename, "rb"))
-            # 事前にQobuzのドメインにアクセスしておく
-            browser.get("https://www.qobuz.com")
-            time.sleep(2)
-            for cookie in cookies:
-                # 一部のブラウザはexpiry属性があるとエラーになる場合がある
-                if 'expiry' in cookie:
-                    del cookie['expiry']
-                browser.add_cookie(cookie)
-            logging.info(f"Cookieをロードしました: {filename}")
-            browser.refresh()  # クッキー適用後にリフレッシュ
-            time.sleep(2)
-            return True
-        else:
-            logging.info("既存のCookieファイルが見つかりません")
+        cookies = read_cookie_store(filename)
+        if not cookies:
+            logging.info("有効なCookieが見つかりません")
             return False
+        
+        logging.info(f"既存のCookieファイルを読み込みます: {filename}")
+        # 事前にQobuzのドメインにアクセスしておく
+        browser.get(QOBUZ_BASE_URL)
+        wait_for_page_ready(browser)
+        if check_login_status(browser):
+            logging.info("プロファイルでログイン済みのため、Cookieの注入を省略します")
+            return True
+        
+        for cookie in cookies:
+            # 一部のブラウザはexpiry属性があるとエラーになる場合がある
+            cookie.pop('expiry', None)
+            browser.add_cookie(cookie)
+        logging.info(f"Cookieをロードしました: {filename}")
+        browser.refresh()  # クッキー適用後にリフレッシュ
+        wait_for_page_ready(browser)
+        return True
     except Exception as e:
         logging.error(f"Cookie読み込み中にエラー: {str(e)}")
         return False
 
+@run_metrics.timed()
 def check_login_status(browser):
     """ログイン状態を確認"""
     try:
         # ユーザープロフィール要素などでログイン状態を確認
         # 注: 以下のXPATHはQobuzの実際のHTML構造に合わせて調整が必要です
         logging.info("ログイン状態を確認中...")
-        browser.save_screenshot("login_check.png")  # デバッグ用
-        elem = browser.find_elements(By.XPATH, "//div[contains(@class, 'userMenu')]")
-        is_logged_in = len(elem) > 0
+        debug_artifacts.checkpoint(browser, "login_check")
+        is_logged_in = len(selector_cache.locate(browser, 'user_menu')) > 0
         logging.info(f"ログイン状態: {'ログイン済み' if is_logged_in else '未ログイン'}")
         return is_logged_in
     except Exception as e:
@@ -198,84 +1187,36 @@ def check_login_status(browser):
         return False
 
 def perform_with_retry(func, *args, max_retries=3, retry_delay=5, **kwargs):
-    """関数実行をリトライするためのラッパー"""
-    for attempt in range(max_retries):
-        try:
-            logging.info(f"関数 {func.__name__} を実行します (試行 {attempt+1}/{max_retries})")
-            return func(*args, **kwargs)
-        except Exception as e:
-            logging.warning(f"試行 {attempt+1}/{max_retries} 失敗: {str(e)}")
-            if attempt < max_retries - 1:
-                # ランダムな待機時間で再試行
-                sleep_time = retry_delay * (1 + random.random())
-                logging.info(f"{sleep_time:.2f}秒後に再試行します...")
-                time.sleep(sleep_time)
-            else:
-                logging.error(f"最大試行回数に達しました: {func.__name__}")
-                raise
+    """関数実行をリトライするためのラッパー（分類できないエラーも再試行する）"""
+    logging.info(f"関数 {func.__name__} を実行します (最大{max_retries}回)")
+    try:
+        return retry_engine.call(func, args, kwargs, max_attempts=max_retries, base_delay=retry_delay,
+                                 retryable=TRANSIENT_ERRORS + ("not_found", "other"))
+    except Exception:
+        logging.error(f"再試行しても失敗しました: {func.__name__}")
+        raise
 
 # 人間のような動きでQobuzにログイン
 # login_to_qobuz関数の修正部分
 
+@run_metrics.timed()
 def login_to_qobuz(browser, email, password):
     """人間らしい動作でQobuzにログインする（改良版）"""
     try:
         # Qobuzのログインページに移動
-        browser.get("https://www.qobuz.com/signin")
+        browser.get(f"{QOBUZ_BASE_URL}/signin")
         logging.info("Qobuzログインページにアクセスしました")
         
-        # ページソースを保存（デバッグ用）
-        with open("login_page_source.html", "w", encoding="utf-8") as f:
-            f.write(browser.page_source)
-        logging.info("ページソースを保存しました")
-        
         # ページの読み込みを待機
-        time.sleep(random.uniform(3, 5))
-        
-        # スクリーンショット保存
-        browser.save_screenshot("login_page.png")
-        logging.info("ログインページのスクリーンショットを保存しました")
+        wait_for_page_ready(browser)
         
-        # より柔軟な要素検索方法を使用
+        # メールアドレス入力フィールドを検索（候補のセレクタはELEMENT_SELECTORSを参照）
         logging.info("メールアドレス入力フィールドを検索中...")
+        email_field = selector_cache.find(browser, 'login_email', timeout=15)
         
-        # 複数のセレクタを試行
-        selectors = [
-            (By.ID, "email"),
-            (By.NAME, "email"),
-            (By.NAME, "username"),
-            (By.ID, "username"),
-            (By.CSS_SELECTOR, "input[type='email']"),
-            (By.XPATH, "//input[@type='email']"),
-            (By.XPATH, "//form//input[contains(@placeholder, 'mail')]"),
-            (By.XPATH, "//form//input[1]")  # フォームの最初のinput要素
-        ]
+        # ページの状態を記録（デバッグ用）
+        debug_artifacts.checkpoint(browser, "login_page", with_source=True)
         
-        email_field = None
-        for selector_type, selector_value in selectors:
-            try:
-                logging.info(f"セレクタを試行中: {selector_type} = {selector_value}")
-                email_field = WebDriverWait(browser, 3).until(
-                    EC.presence_of_element_located((selector_type, selector_value))
-                )
-                if email_field:
-                    logging.info(f"メールアドレス入力フィールドを発見: {selector_type} = {selector_value}")
-                    break
-            except:
-                continue
-        
-        if not email_field:
-            # ページ上のすべてのinput要素を探す
-            inputs = browser.find_elements(By.TAG_NAME, "input")
-            logging.info(f"{len(inputs)}個のinput要素を発見")
-            
-            if len(inputs) > 0:
-                email_field = inputs[0]  # 最初のinput要素を使用
-                logging.info("最初のinput要素をメールアドレスフィールドとして使用します")
-            else:
-                raise Exception("メールアドレス入力フィールドが見つかりませんでした")
-        
-        # 以下、入力処理は同様
         email_field.click()
         logging.info("メールアドレス入力フィールドを選択しました")
         
@@ -283,38 +1224,57 @@ def login_to_qobuz(browser, email, password):
         for char in email:
             email_field.send_keys(char)
             time.sleep(random.uniform(0.05, 0.15))
-            
-        time.sleep(random.uniform(1, 2))
         
-        # 後続のパスワード入力処理も同様の方法で柔軟に対応
-        # ...
+        # パスワード入力
+        logging.info("パスワード入力フィールドを検索中...")
+        password_field = selector_cache.find(browser, 'login_password')
+        password_field.click()
+        for char in password:
+            password_field.send_keys(char)
+            time.sleep(random.uniform(0.05, 0.15))
+        
+        # ログインボタンをクリック
+        logging.info("ログインボタンをクリックします")
+        submit_button = selector_cache.find(browser, 'login_submit', clickable=True)
+        submit_button.click()
+        
+        # ログイン完了（ユーザーメニューの表示）を待機
+        try:
+            selector_cache.find(browser, 'user_menu', timeout=15)
+        except Exception:
+            pass
+        if not check_login_status(browser):
+            raise Exception("ログイン後もログイン状態を確認できませんでした")
+        
+        logging.info("Qobuzへのログインに成功しました")
+        return True
+    except Exception as e:
+        logging.error(f"Qobuzログインエラー: {str(e)}")
+        debug_artifacts.capture_error(browser, "login_error")
+        raise
 
 # プレイリスト作成とトラック追加
+@run_metrics.timed()
 def create_qobuz_playlist(browser, playlist_name):
     """Qobuzで新しいプレイリストを作成"""
     try:
         # プレイリストページに移動
-        browser.get("https://www.qobuz.com/my-profile/playlists")
+        browser.get(f"{QOBUZ_BASE_URL}/my-profile/playlists")
         logging.info("Qobuzプレイリストページにアクセスしました")
-        time.sleep(random.uniform(2, 3))
+        wait_for_page_ready(browser)
         
-        # ページ表示のデバッグ用にスクリーンショット
-        browser.save_screenshot("playlist_page.png")
+        # ページの状態を記録（デバッグ用）
+        debug_artifacts.checkpoint(browser, "playlist_page")
         
         # 「新規プレイリスト作成」ボタンをクリック
         logging.info("プレイリスト作成ボタンを検索中...")
-        create_button = WebDriverWait(browser, 10).until(
-            EC.element_to_be_clickable((By.XPATH, "//button[contains(text(), 'Create a playlist')]"))  # 実際のテキストに合わせて調整
-        )
+        create_button = selector_cache.find(browser, 'create_playlist_button', clickable=True)
         logging.info("プレイリスト作成ボタンをクリックします")
         create_button.click()
-        time.sleep(random.uniform(1, 2))
         
         # プレイリスト名入力
         logging.info("プレイリスト名入力フィールドを検索中...")
-        name_field = WebDriverWait(browser, 10).until(
-            EC.element_to_be_clickable((By.XPATH, "//input[@placeholder='Playlist name']"))  # 実際のプレースホルダーに合わせて調整
-        )
+        name_field = selector_cache.find(browser, 'playlist_name_input', clickable=True)
         name_field.clear()
         logging.info(f"プレイリスト名 '{playlist_name}' を入力中...")
         for char in playlist_name:
@@ -323,14 +1283,18 @@ def create_qobuz_playlist(browser, playlist_name):
         
         # 保存ボタンをクリック
         logging.info("保存ボタンを検索中...")
-        save_button = browser.find_element(By.XPATH, "//button[contains(text(), 'Create')]")  # 実際のテキストに合わせて調整
+        save_button = selector_cache.find(browser, 'playlist_save_button', timeout=0)
+        previous_url = browser.current_url
         logging.info("保存ボタンをクリックします")
         save_button.click()
         
-        # 作成完了を待機
-        wait_time = random.uniform(2, 3)
-        logging.info(f"プレイリスト作成の完了を{wait_time:.1f}秒間待機します")
-        time.sleep(wait_time)
+        # 作成完了（作成したプレイリストのページへの遷移）を待機
+        logging.info("プレイリスト作成の完了を待機します")
+        try:
+            WebDriverWait(browser, 15).until(EC.url_changes(previous_url))
+        except Exception:
+            logging.warning("プレイリスト作成後にページが遷移しませんでした")
+        wait_for_page_ready(browser)
         
         # 作成されたプレイリストのURLを取得
         current_url = browser.current_url
@@ -339,56 +1303,652 @@ def create_qobuz_playlist(browser, playlist_name):
         return current_url
     except Exception as e:
         logging.error(f"プレイリスト作成エラー: {str(e)}")
-        browser.save_screenshot("playlist_create_error.png")
+        debug_artifacts.capture_error(browser, "playlist_create_error")
         return None
 
-def search_and_add_track(browser, track):
-    """トラックを検索して追加"""
+def _extract_qobuz_track_id(element):
+    """検索結果の要素からQobuzのトラックIDを取り出す（見つからなければNone）"""
+    for attr in ("data-track-id", "data-id"):
+        value = element.get_attribute(attr)
+        if value:
+            return value
+    links = element.find_elements(By.XPATH, ".//a[contains(@href, '/track/')]")
+    if links:
+        href = links[0].get_attribute("href") or ""
+        return href.rstrip("/").rsplit("/", 1)[-1] or None
+    return None
+
+# トラックのマッチング（正規化とスコアリング）
+MATCH_THRESHOLD = 0.6
+MATCH_CANDIDATE_LIMIT = 50
+
+# 元のトラックにない場合に減点するバージョン表記
+VERSION_KEYWORDS = ("live", "karaoke", "instrumental", "remaster", "remastered", "acoustic",
+                    "remix", "demo", "edit", "version", "mix", "cover", "tribute")
+
+_FEAT_RE = re.compile(r"[\(\[]?\b(feat|ft|featuring)\b\.?.*$", re.IGNORECASE)
+_DASH_SUFFIX_RE = re.compile(r"\s+-\s+.*$")
+_BRACKET_RE = re.compile(r"[\(\[\{][^\)\]\}]*[\)\]\}]")
+_NON_WORD_RE = re.compile(r"[^\w\s]")
+
+def _strip_diacritics(text):
+    return "".join(ch for ch in unicodedata.normalize("NFKD", text) if not unicodedata.combining(ch))
+
+def _version_tags(text):
+    """括弧や「 - 」以降に付いたバージョン表記の単語を集める"""
+    lowered = _strip_diacritics(text).lower()
+    suffixes = _BRACKET_RE.findall(lowered)
+    dash = _DASH_SUFFIX_RE.search(lowered)
+    if dash:
+        suffixes.append(dash.group(0))
+    words = set(_NON_WORD_RE.sub(" ", " ".join(suffixes)).split())
+    return words.intersection(VERSION_KEYWORDS)
+
+def normalize_title(text):
+    """曲名を比較用に正規化（ダイアクリティカルマーク、feat.、- Remastered、括弧内を除去）"""
+    text = _strip_diacritics(text or "").lower()
+    text = _FEAT_RE.sub("", text)
+    text = _DASH_SUFFIX_RE.sub("", text)
+    text = _BRACKET_RE.sub("", text)
+    return " ".join(_NON_WORD_RE.sub(" ", text).split())
+
+def normalize_artist(text):
+    """アーティスト名を比較用に正規化"""
+    return " ".join(artist_credits(text))
+
+def artist_credits(text):
+    """アーティスト表記（"A, B" や "A feat. B" など）を正規化したアーティスト名のリストに分ける"""
+    text = _strip_diacritics(text or "").lower()
+    text = re.sub(r"\b(feat|ft|featuring)\b\.?", ",", text)
+    text = text.replace("&", ",").replace(" and ", ",").replace(" x ", ",")
+    credits = (" ".join(_NON_WORD_RE.sub(" ", part).split()) for part in text.split(","))
+    return [credit for credit in credits if credit]
+
+def _token_similarity(a, b):
+    """トークン集合のDice係数（0〜1）"""
+    if not a or not b:
+        return 0.0
+    return 2 * len(a & b) / (len(a) + len(b))
+
+def _duration_similarity(expected_seconds, actual_seconds):
+    if not expected_seconds or not actual_seconds:
+        return None
+    diff = abs(expected_seconds - actual_seconds)
+    if diff <= 2:
+        return 1.0
+    return max(0.0, 1.0 - (diff - 2) / 30)
+
+def score_candidates(track, candidates):
+    """検索結果の候補をまとめてスコアリングし、スコアの高い順に返す
+
+    元のトラック側の正規化は一度だけ行い、候補ごとの計算は集合演算のみにする。
+    両方にアーティスト名があって1語も一致しない候補（別アーティストのカバーなど）は
+    曲名と再生時間が一致していてもスコアを0にする。
+    戻り値は [(スコア, 候補), ...]。
+    """
+    title_tokens = set(normalize_title(track['name']).split())
+    artist_tokens = set(normalize_artist(track['artist']).split())
+    album_tokens = set(normalize_title(track.get('album')).split())
+    source_versions = _version_tags(track['name'])
+    duration_ms = track.get('duration_ms')
+    expected_seconds = duration_ms / 1000 if duration_ms else None
+    
+    scored = []
+    for candidate in candidates:
+        title_score = _token_similarity(title_tokens, set(normalize_title(candidate.get('title')).split()))
+        candidate_artist_tokens = set(normalize_artist(candidate.get('artist')).split())
+        artist_score = _token_similarity(artist_tokens, candidate_artist_tokens)
+        if artist_tokens and candidate_artist_tokens and artist_score == 0:
+            scored.append((0.0, candidate))
+            continue
+        album_score = _token_similarity(album_tokens, set(normalize_title(candidate.get('album')).split()))
+        duration_score = _duration_similarity(expected_seconds, candidate.get('duration'))
+        
+        # 重み付け（再生時間が不明な場合はその分を他に配分）
+        if duration_score is None:
+            score = 0.55 * title_score + 0.35 * artist_score + 0.10 * album_score
+        else:
+            score = 0.45 * title_score + 0.30 * artist_score + 0.10 * album_score + 0.15 * duration_score
+        
+        # 元のトラックにないバージョン（ライブ、カラオケなど）は減点
+        extra_versions = _version_tags(candidate.get('title') or "") - source_versions
+        if extra_versions:
+            score -= 0.3 * len(extra_versions)
+        scored.append((max(0.0, min(1.0, score)), candidate))
+    
+    scored.sort(key=lambda pair: pair[0], reverse=True)
+    return scored
+
+def find_best_match(track, candidates, threshold=MATCH_THRESHOLD):
+    """最もスコアの高い候補と信頼度を返す。閾値未満の場合は (None, 信頼度)"""
+    scored = score_candidates(track, candidates)
+    if not scored:
+        return None, 0.0
+    confidence, best = scored[0]
+    if confidence < threshold:
+        return None, confidence
+    return best, confidence
+
+# 検索の実行計画（ISRC完全一致 → 安いクエリから順にフォールバック）
+LOOKUP_TIERS = ("isrc", "artist_title", "title_album", "title")
+
+def plan_lookup_queries(track, use_isrc=True):
+    """試行する (段階, 検索クエリ) を順に返す。情報が欠けている段階は飛ばす
+
+    use_isrc=False の場合はISRCの段階を飛ばす（ISRCで検索できないバックエンド向け）。
+    """
+    title = normalize_title(track['name']) or track['name']
+    plans = {
+        'isrc': track.get('isrc'),
+        'artist_title': f"{track['artist']} {track['name']}",
+        'title_album': f"{title} {track['album']}" if track.get('album') else None,
+        'title': title,
+    }
+    seen = set()
+    for tier in LOOKUP_TIERS:
+        if tier == "isrc" and not use_isrc:
+            continue
+        query = plans[tier]
+        if query and query not in seen:
+            seen.add(query)
+            yield tier, query
+
+def resolve_track(backend, track, threshold=MATCH_THRESHOLD, rate_limiter=None):
+    """実行計画に沿って検索し、最初に信頼できる一致が見つかった段階で打ち切る
+
+    ISRCの段階では、ISRCが一致した候補を信頼度1.0で採用する。
+    候補にISRC情報がない場合は通常のスコアリングで判定する。
+    ISRCで検索できないバックエンド（supports_isrc=False）ではISRCの段階を飛ばす。
+    検索の前には毎回rate_limiterでペースを調整する。アクセス制限や通信エラーの場合は
+    retry_engineが待機してから同じクエリを再試行する。
+    戻り値は (候補, 信頼度, 一致した段階)。見つからない場合は (None, 最高スコア, None)。
+    """
+    rate_limiter = rate_limiter or rate_limiter_for(backend)
+    best_confidence = 0.0
+    for tier, query in plan_lookup_queries(track, use_isrc=getattr(backend, 'supports_isrc', True)):
+        logging.info(f"検索クエリ ({tier}): {query}")
+        
+        def search():
+            rate_limiter.acquire()
+            try:
+                with run_metrics.span("search"):
+                    return backend.search(query, limit=MATCH_CANDIDATE_LIMIT)
+            except ThrottledError as e:
+                rate_limiter.report_throttled(e.retry_after)
+                raise
+        
+        try:
+            candidates = retry_engine.call(search)
+        except CircuitOpenError:
+            raise
+        except Exception as e:
+            logging.warning(f"検索に失敗しました ({tier}): {str(e)}")
+            candidates = None
+        if not candidates:
+            if candidates is not None:
+                rate_limiter.report_empty()
+            continue
+        rate_limiter.report_success()
+        
+        if tier == "isrc":
+            isrc = track['isrc'].upper()
+            exact = [c for c in candidates if (c.get('isrc') or "").upper() == isrc]
+            if exact:
+                run_metrics.incr(f"match_tier_{tier}")
+                return exact[0], 1.0, tier
+            if any(c.get('isrc') for c in candidates):
+                # ISRC情報はあるが一致しない（別の曲がヒットした）
+                continue
+        
+        best, confidence = find_best_match(track, candidates, threshold)
+        best_confidence = max(best_confidence, confidence)
+        if best:
+            run_metrics.incr(f"match_tier_{tier}")
+            return best, confidence, tier
+    return None, best_confidence, None
+
+# 検索バックエンド
+# search(query) は候補のリストを返す。各候補は以下のキーを持つ辞書:
+#   qobuz_id, title, artist, album, duration（秒、不明ならNone）, isrc（不明ならNone）
+class SeleniumSearchBackend:
+    """Qobuzの検索ページをブラウザで開いて結果を取得するバックエンド"""
+    name = "selenium"
+    # 検索ページはISRCでの検索に対応していないので、ISRCの段階は使わない
+    supports_isrc = False
+
+    def __init__(self, browser):
+        self.browser = browser
+
+    def search(self, query, limit=10):
+        browser = self.browser
+        browser.get(f"{QOBUZ_BASE_URL}/search?q={quote_plus(query)}")
+        logging.info(f"検索ページにアクセスしました: {query}")
+        wait_for_page_ready(browser)
+        
+        # ページの状態を記録（デバッグ用）
+        debug_artifacts.checkpoint(browser, f"search_{query}")
+        
+        # 検索結果のトラック、結果なしの表示、CAPTCHAのいずれかが表示されるまで待機
+        elements = []
+        def results_ready(driver):
+            elements[:] = selector_cache.locate(driver, 'search_result', many=True)
+            return (elements or driver.find_elements(By.XPATH, "//*[contains(@class, 'no-result')]")
+                    or _page_has_captcha(driver))
+        try:
+            WebDriverWait(browser, 10).until(results_ready)
+        except Exception:
+            logging.info("検索結果が表示されませんでした")
+        if _page_has_captcha(browser):
+            raise ThrottledError("検索ページでCAPTCHAが表示されました")
+        elements = elements[:limit]
+        candidates = []
+        for element in elements:
+            duration = element.get_attribute("data-duration")
+            candidates.append({
+                'qobuz_id': _extract_qobuz_track_id(element),
+                'title': element.get_attribute("data-title") or element.text.split("\n")[0],
+                'artist': element.get_attribute("data-artist") or "",
+                'album': element.get_attribute("data-album") or "",
+                'duration': int(duration) if duration and duration.isdigit() else None,
+                'isrc': element.get_attribute("data-isrc"),
+                'element': element,
+            })
+        return candidates
+
+# Qobuz APIの認証トークンが入っている可能性のあるCookie名
+QOBUZ_API_BASE_URL = f"{QOBUZ_BASE_URL}/api.json/0.2"
+QOBUZ_TOKEN_COOKIES = ("user_auth_token", "qobuz_user_auth_token", "X-User-Auth-Token")
+
+def load_qobuz_auth_token(filename=COOKIE_FILE):
+    """save_cookiesで保存したCookieからQobuzの認証トークンを取り出す"""
+    token = os.environ.get("QOBUZ_USER_AUTH_TOKEN")
+    if token:
+        return token
+    for cookie in read_cookie_store(filename):
+        if cookie.get('name') in QOBUZ_TOKEN_COOKIES and cookie.get('value'):
+            return cookie['value']
+    return None
+
+def _api_track_to_candidate(item):
+    """Qobuz APIのトラックオブジェクトを検索候補に変換"""
+    title = item.get('title') or ""
+    if item.get('version'):
+        title = f"{title} ({item['version']})"
+    performer = (item.get('performer') or {}).get('name')
+    album = item.get('album') or {}
+    return {
+        'qobuz_id': str(item['id']),
+        'title': title,
+        'artist': performer or (album.get('artist') or {}).get('name', ""),
+        'album': album.get('title', ""),
+        'duration': item.get('duration'),
+        'isrc': item.get('isrc'),
+    }
+
+class QobuzApiSearchBackend:
+    """QobuzカタログのJSON検索APIを使うバックエンド（ブラウザ不要）
+
+    認証トークンがあればプレイリストへの一括追加にも使う。
+    keep-aliveの接続をプールしたセッションを使い回す。
+    base_urlを差し替えればローカルのスタブサーバーに向けられる。
+    """
+    name = "api"
+    supports_isrc = True
+
+    def __init__(self, app_id, auth_token=None, base_url=QOBUZ_API_BASE_URL, timeout=10, pool_size=8):
+        self.app_id = app_id
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers.update({"X-App-Id": str(app_id)})
+        self.set_auth_token(auth_token)
+
+    def set_auth_token(self, auth_token):
+        """再ログイン後などに認証トークンを差し替える"""
+        self.auth_token = auth_token
+        if auth_token:
+            self.session.headers["X-User-Auth-Token"] = auth_token
+
+    def _request(self, method, path, params):
+        if method == "GET":
+            response = self.session.get(f"{self.base_url}/{path}", params={**params, "app_id": self.app_id},
+                                        timeout=self.timeout)
+        else:
+            response = self.session.post(f"{self.base_url}/{path}", data={**params, "app_id": self.app_id},
+                                         timeout=self.timeout)
+        if response.status_code == 401:
+            raise AuthExpiredError("APIの認証トークンが無効です (401)")
+        if response.status_code == 429:
+            retry_after = response.headers.get("Retry-After")
+            raise ThrottledError("APIのレート制限に達しました (429)",
+                                 retry_after=float(retry_after) if retry_after and retry_after.isdigit() else None)
+        response.raise_for_status()
+        return response.json()
+
+    def search(self, query, limit=10):
+        data = self._request("GET", "track/search", {"query": query, "limit": limit})
+        items = (data.get('tracks') or {}).get('items') or []
+        return [_api_track_to_candidate(item) for item in items]
+
+    def _paginate(self, path, params, key, page_size=500):
+        """offset/limitでページングされた一覧をすべて取得する"""
+        offset = 0
+        while True:
+            page = self._request("GET", path, {**params, "limit": page_size, "offset": offset}).get(key) or {}
+            items = page.get('items') or []
+            yield from items
+            offset += len(items)
+            if not items or offset >= page.get('total', 0):
+                break
+
+    def get_user_playlists(self):
+        """ログイン中のユーザーのプレイリスト一覧（IDと名前）"""
+        return [{'id': str(item['id']), 'name': item.get('name', "")}
+                for item in self._paginate("playlist/getUserPlaylists", {}, 'playlists')]
+
+    def get_playlist_tracks(self, playlist_id):
+        """プレイリストの全トラックを検索候補と同じ形式で返す（削除用のplaylist_track_idを含む）"""
+        tracks = []
+        for item in self._paginate("playlist/get", {"playlist_id": playlist_id, "extra": "tracks"}, 'tracks'):
+            entry = _api_track_to_candidate(item)
+            entry['playlist_track_id'] = item.get('playlist_track_id')
+            tracks.append(entry)
+        return tracks
+
+    def delete_tracks_from_playlist(self, playlist_id, playlist_track_ids):
+        """プレイリストから複数のトラックを1リクエストで削除する"""
+        return self._request("POST", "playlist/deleteTracks", {
+            "playlist_id": playlist_id,
+            "playlist_track_ids": ",".join(str(track_id) for track_id in playlist_track_ids),
+        })
+
+    def add_tracks_to_playlist(self, playlist_id, qobuz_ids):
+        """複数のトラックを1リクエストでプレイリストに追加する（認証トークンが必要）"""
+        return self._request("POST", "playlist/addTracks", {
+            "playlist_id": playlist_id,
+            "track_ids": ",".join(str(qobuz_id) for qobuz_id in qobuz_ids),
+            "no_duplicate": "true",
+        })
+
+    def close(self):
+        self.session.close()
+
+def create_search_backend(name="selenium", cookie_file=COOKIE_FILE):
+    """検索バックエンドを作成する
+
+    seleniumの場合はブラウザごとにバックエンドを作るのでNoneを返す。
+    APIバックエンドに必要なQOBUZ_APP_IDがない場合もNone（Seleniumで検索）。
+    """
+    if name == "api":
+        app_id = os.environ.get("QOBUZ_APP_ID")
+        if not app_id:
+            logging.error("QOBUZ_APP_IDが設定されていないため、Seleniumで検索します")
+            return None
+        base_url = os.environ.get("QOBUZ_API_BASE_URL", QOBUZ_API_BASE_URL)
+        logging.info(f"APIバックエンドで検索します: {base_url}")
+        return QobuzApiSearchBackend(app_id, load_qobuz_auth_token(cookie_file), base_url=base_url)
+    return None
+
+def find_qobuz_track(browser, track, match_cache=None, search_backend=None):
+    """トラックを検索してQobuzのトラックIDを決める（プレイリストへの追加はまとめて行う）
+
+    search_backendを省略した場合はこのブラウザで検索ページを開く。
+    """
     try:
-        # 検索クエリの作成
-        search_query = f"{track['artist']} {track['name']}"
-        logging.info(f"検索クエリ: {search_query}")
-        
-        # 検索ページに移動
-        encoded_query = search_query.replace(' ', '+')
-        browser.get(f"https://www.qobuz.com/search?q={encoded_query}")
-        logging.info(f"検索ページにアクセスしました: {encoded_query}")
-        time.sleep(random.uniform(2, 4))
-        
-        # ページ表示のデバッグ用にスクリーンショット
-        browser.save_screenshot(f"search_{track['name']}.png")
-        
-        # 検索結果の最初のトラックを選択
-        logging.info("検索結果から最初のトラックを検索中...")
-        first_track = WebDriverWait(browser, 10).until(
-            EC.element_to_be_clickable((By.XPATH, "//div[contains(@class, 'track-item')]"))  # 実際のクラスに合わせて調整
-        )
+        # ISRC → アーティスト+曲名 → 曲名+アルバム → 曲名 の順に検索
+        backend = search_backend or SeleniumSearchBackend(browser)
+        best, confidence, tier = resolve_track(backend, track)
+        if not best:
+            track['match_confidence'] = confidence
+            raise Exception(f"一致するトラックが見つかりませんでした (最高スコア {confidence:.2f})")
+        logging.info(f"一致候補 ({tier}): {best['artist']} - {best['title']} (信頼度 {confidence:.2f})")
+        track['match_tier'] = tier
         
-        # この部分は実際のQobuzのUIに合わせて調整が必要
-        # 右クリックして「プレイリストに追加」を選択する部分は
-        # JavaScriptの実行やアクションチェーンを使って実装する必要があります
+        # マッチ結果をキャッシュに保存（次回以降の検索を省略する）
+        qobuz_id = best['qobuz_id']
+        track['qobuz_id'] = qobuz_id
+        track['match_confidence'] = confidence
+        if match_cache and qobuz_id:
+            match_cache.put(_track_cache_key(track), qobuz_id, confidence)
         
-        logging.info(f"トラック追加: {search_query}")
+        run_metrics.incr("matched")
         return True
+    except CircuitOpenError:
+        raise
     except Exception as e:
-        logging.error(f"トラック追加エラー: {str(e)}")
-        browser.save_screenshot(f"track_add_error_{track['name']}.png")
+        run_metrics.incr("failed")
+        logging.error(f"トラック検索エラー: {track['artist']} - {track['name']}: {str(e)}")
+        # ブラウザを使わない検索ではページの状態がないので記録しない
+        if browser is not None:
+            debug_artifacts.capture_error(browser, f"track_search_error_{track['name']}")
         return False
 
-# SpotifyからQobuzへの同期メイン関数
-def sync_to_qobuz(spotify_tracks, qobuz_email, qobuz_password):
-    """SpotifyのトラックをQobuzに同期する改良版"""
-    logging.info("Qobuz同期を開始します")
+def find_qobuz_track_with_cache(browser, track, match_cache=None, search_backend=None):
+    """キャッシュを参照してからトラックを検索する
+
+    戻り値は (IDが決まったか, キャッシュヒットだったか)。
+    キャッシュヒット時は検索ページを開かない。
+    """
+    cached = match_cache.get(_track_cache_key(track)) if match_cache else None
+    if match_cache:
+        run_metrics.incr("cache_hits" if cached else "cache_misses")
+    if cached:
+        track['qobuz_id'] = cached['qobuz_id']
+        track['match_confidence'] = cached['confidence']
+        track['match_tier'] = "cache"
+        logging.info(f"キャッシュヒット: Qobuz ID {cached['qobuz_id']} (信頼度 {cached['confidence']:.2f})")
+        return True, True
+    return find_qobuz_track(browser, track, match_cache=match_cache, search_backend=search_backend), False
+
+# プレイリストへの一括追加
+QOBUZ_ADD_BATCH_SIZE = int(os.environ.get("QOBUZ_ADD_BATCH_SIZE") or "50")
+
+def _qobuz_playlist_id(playlist_url):
+    """プレイリストのURLからQobuzのプレイリストIDを取り出す"""
+    match = re.search(r"/playlists?/(\d+)", playlist_url or "")
+    return match.group(1) if match else None
+
+def create_playlist_client(search_backend=None, cookie_file=COOKIE_FILE):
+    """一括追加に使うAPIクライアントを返す
+
+    認証トークン付きのAPIバックエンドがあればそれを使い、なければログイン後に保存した
+    Cookieのトークンで作成する。QOBUZ_APP_IDかトークンがない場合はNone（追加できない）。
+    戻り値は (クライアント, 新しく作成したか)。
+    """
+    if isinstance(search_backend, QobuzApiSearchBackend) and search_backend.auth_token:
+        return search_backend, False
+    app_id = os.environ.get("QOBUZ_APP_ID")
+    auth_token = load_qobuz_auth_token(cookie_file)
+    if not (app_id and auth_token):
+        return None, False
+    base_url = os.environ.get("QOBUZ_API_BASE_URL", QOBUZ_API_BASE_URL)
+    return QobuzApiSearchBackend(app_id, auth_token, base_url=base_url), True
+
+def _add_tracks_via_ui(browser, playlist_url, qobuz_ids):
+    """ブラウザでトラックをプレイリストに追加する（APIが使えない場合）
+
+    戻り値は追加できなかったQobuz IDのリスト。
+    """
+    # この部分は実際のQobuzのUIに合わせて調整が必要
+    # 検索結果で複数のトラックを選択して「プレイリストに追加」を選ぶ操作を
+    # JavaScriptの実行やアクションチェーンを使って実装する必要があります
+    # 実装されるまでは追加済みとして記録しないよう、すべて失敗として返す
+    logging.error(f"ブラウザでのトラック追加には対応していません。QOBUZ_APP_IDと認証トークンを設定してください ({len(qobuz_ids)}曲)")
+    return list(qobuz_ids)
+
+def add_tracks_in_batches(browser, playlist_url, qobuz_ids, client=None, batch_size=QOBUZ_ADD_BATCH_SIZE):
+    """トラックをbatch_size曲ずつまとめてプレイリストに追加する
+
+    clientがあればAPIの一括追加を1バッチ1リクエストで呼び、なければブラウザで追加する。
+    レート制限や通信エラーはretry_engineで再送し、それ以外で失敗したバッチは
+    半分に分けて再送して、追加できないトラックだけを特定する。
+    戻り値は追加に失敗したQobuz IDの集合。
+    """
+    playlist_id = _qobuz_playlist_id(playlist_url) if client else None
+    if client and not playlist_id:
+        logging.error(f"プレイリストIDを取得できないため、ブラウザで追加します: {playlist_url}")
     
-    browser = None
+    def add_batch(batch):
+        # 戻り値は追加できなかったID
+        with run_metrics.span("add_batch"):
+            if playlist_id:
+                client.add_tracks_to_playlist(playlist_id, batch)
+                rejected = []
+            else:
+                rejected = _add_tracks_via_ui(browser, playlist_url, batch)
+        run_metrics.incr("add_batches")
+        return rejected
+    
+    batches = deque(qobuz_ids[i:i + batch_size] for i in range(0, len(qobuz_ids), batch_size))
+    failed = set()
+    while batches:
+        batch = batches.popleft()
+        try:
+            # レート制限・通信エラーは分割せず、retry_engineが同じバッチを再送する
+            rejected = retry_engine.call(add_batch, (batch,))
+            failed.update(rejected)
+            if len(batch) > len(rejected):
+                logging.info(f"{len(batch) - len(rejected)}曲をプレイリストに追加しました")
+        except CircuitOpenError:
+            raise
+        except Exception as e:
+            if classify_error(e) == "auth":
+                # 認証エラーは分割しても解決しないので残りをすべて失敗とする
+                failed.update(batch)
+                for remaining in batches:
+                    failed.update(remaining)
+                batches.clear()
+                logging.error(f"一括追加の認証に失敗しました: {str(e)}")
+            elif len(batch) == 1:
+                failed.update(batch)
+                logging.error(f"トラック追加エラー: Qobuz ID {batch[0]}: {str(e)}")
+            else:
+                half = len(batch) // 2
+                logging.warning(f"{len(batch)}曲の一括追加に失敗しました。分割して再送します: {str(e)}")
+                batches.appendleft(batch[half:])
+                batches.appendleft(batch[:half])
+    
+    if failed:
+        run_metrics.incr("add_failed", len(failed))
+        logging.error(f"追加に失敗したトラック: {len(failed)}/{len(qobuz_ids)}曲 ({', '.join(sorted(failed))})")
+    return failed
+
+# 既存プレイリストへの反映（upsert）
+class QobuzPlaylistIndex:
+    """既存プレイリストの内容を、トラックIDと正規化したアーティスト+曲名で引けるようにした索引"""
+
+    def __init__(self, entries=()):
+        self.by_id = {}
+        self.by_name = {}
+        for entry in entries:
+            self.add(entry)
+
+    @staticmethod
+    def name_key(artist, title):
+        """先頭のアーティストと曲名（バージョン表記は区別する）から比較用のキーを作る"""
+        credits = artist_credits(artist)
+        primary_artist = credits[0] if credits else ""
+        tags = ",".join(sorted(_version_tags(title or "")))
+        return f"{primary_artist}|{normalize_title(title)}|{tags}"
+
+    def add(self, entry):
+        self.by_id.setdefault(str(entry['qobuz_id']), entry)
+        self.by_name.setdefault(self.name_key(entry.get('artist'), entry.get('title')), entry)
+
+    def find(self, track):
+        """Spotifyのトラックに対応するエントリを返す（Qobuz IDが決まっていればIDで照合）"""
+        if track.get('qobuz_id'):
+            entry = self.by_id.get(str(track['qobuz_id']))
+            if entry:
+                return entry
+        return self.by_name.get(self.name_key(track.get('artist'), track.get('name')))
+
+    def __len__(self):
+        return len(self.by_id)
+
+def find_qobuz_playlist(browser, target, client=None):
+    """名前またはIDで既存のプレイリストを探し、URLを返す（見つからなければNone）
+
+    一覧を取得できなかった場合は例外を送出する（「見つからない」と区別して重複作成を防ぐ）。
+    """
+    target = str(target).strip()
+    if target.isdigit():
+        return f"{QOBUZ_BASE_URL}/playlist/{target}"
+    if client:
+        for playlist in client.get_user_playlists():
+            if playlist['name'] == target:
+                return f"{QOBUZ_BASE_URL}/playlist/{playlist['id']}"
+        return None
+    
+    # この部分は実際のQobuzのUIに合わせて調整が必要
+    # 一覧の要素がなければ読み込みに失敗したとみなす（空の文字列は「一覧はあるが見つからない」）
+    browser.get(f"{QOBUZ_BASE_URL}/my-profile/playlists")
+    wait_for_page_ready(browser)
+    href = browser.execute_script(
+        "const list = document.querySelector(\"[class*='playlists']\");"
+        "if (!list) return null;"
+        "const link = Array.from(list.querySelectorAll('a[href*=\"/playlist/\"]'))"
+        ".find(a => a.textContent.trim() === arguments[0]);"
+        "return link ? link.href : '';",
+        target,
+    )
+    if href is None:
+        raise Exception("プレイリスト一覧を読み込めませんでした")
+    return href or None
+
+def load_qobuz_playlist_index(browser, playlist_url, client=None):
+    """プレイリストの現在の内容を1回だけ読み込んで索引にする"""
+    playlist_id = _qobuz_playlist_id(playlist_url)
+    with run_metrics.span("load_playlist"):
+        if client and playlist_id:
+            entries = client.get_playlist_tracks(playlist_id)
+        else:
+            # この部分は実際のQobuzのUIに合わせて調整が必要
+            # 全行の属性を1回のスクリプト実行でまとめて取得する
+            browser.get(playlist_url)
+            wait_for_page_ready(browser)
+            entries = browser.execute_script(
+                "return Array.from(document.querySelectorAll('div.track-item')).map(row => ({"
+                "qobuz_id: row.getAttribute('data-track-id'), title: row.getAttribute('data-title') || row.textContent.trim(),"
+                "artist: row.getAttribute('data-artist') || '', playlist_track_id: row.getAttribute('data-playlist-track-id')"
+                "})).filter(entry => entry.qobuz_id);"
+            ) or []
+    index = QobuzPlaylistIndex(entries)
+    logging.info(f"既存プレイリストの内容を読み込みました: {len(index)}曲")
+    return index
+
+def remove_stale_tracks(browser, playlist_url, entries, client=None, batch_size=QOBUZ_ADD_BATCH_SIZE):
+    """Spotify側にないトラックをプレイリストから削除し、削除した曲数を返す"""
+    playlist_id = _qobuz_playlist_id(playlist_url)
+    if client and playlist_id and all(entry.get('playlist_track_id') for entry in entries):
+        removed = 0
+        for i in range(0, len(entries), batch_size):
+            batch = entries[i:i + batch_size]
+            try:
+                client.delete_tracks_from_playlist(playlist_id, [entry['playlist_track_id'] for entry in batch])
+                removed += len(batch)
+            except Exception as e:
+                logging.error(f"トラック削除エラー: {len(batch)}曲: {str(e)}")
+        return removed
+    return sum(1 for entry in entries if remove_track_from_qobuz_playlist(browser, playlist_url, entry['qobuz_id']))
+
+# ブラウザを起動してQobuzにログインした状態にする
+@run_metrics.timed()
+def start_qobuz_session(qobuz_email, qobuz_password, cookie_file=COOKIE_FILE):
+    """ブラウザを起動し、Cookieまたは通常ログインでQobuzにログインする
+
+    cookie_fileはアカウントごとに分ける（複数アカウントを同期する場合）。
+    """
+    # ブラウザ設定
+    logging.info("ブラウザを設定中...")
+    browser = setup_browser()
     try:
-        # ブラウザ設定
-        logging.info("ブラウザを設定中...")
-        browser = setup_browser()
-        
         # Cookie認証を試みる
         logging.info("Cookieによる認証を試みます")
-        cookie_auth_success = load_cookies(browser)
+        cookie_auth_success = load_cookies(browser, cookie_file)
         
         # Cookie認証失敗または未ログインの場合、通常ログイン
         if not cookie_auth_success or not check_login_status(browser):
@@ -398,63 +1958,1025 @@ def sync_to_qobuz(spotify_tracks, qobuz_email, qobuz_password):
             if login_success:
                 # 成功したらCookieを保存
                 logging.info("ログイン成功: Cookieを保存します")
-                save_cookies(browser)
+                save_cookies(browser, cookie_file)
             else:
                 raise Exception("Qobuzへのログインに失敗しました")
         
-        # ログイン後の待機
-        wait_time = random.uniform(2, 4)
-        logging.info(f"ログイン処理完了後、{wait_time:.1f}秒間待機します")
-        time.sleep(wait_time)
+        # ログイン後のページ読み込みを待機
+        wait_for_page_ready(browser)
+        return browser
+    except Exception:
+        browser.quit()
+        raise
+
+# 並列ブラウザワーカープール
+def _browser_is_alive(browser):
+    """ブラウザ（ドライバー）が応答するかを確認"""
+    try:
+        browser.execute_script("return 1")
+        return True
+    except Exception:
+        return False
+
+def _quit_browser(browser):
+    try:
+        browser.quit()
+    except Exception:
+        pass
+
+def run_browser_worker_pool(tracks, browser_factory, handler, workers=1, initial_browsers=(), max_restarts=3):
+    """複数のブラウザで共有キューからトラックを処理し、元の順序で結果を返す
+
+    各ワーカーは専用のブラウザを持ち、処理の前後で応答を確認する。
+    ドライバーが落ちていればbrowser_factoryで作り直し、そのトラックを1回だけ再試行する。
+    作り直しがmax_restartsを超えたワーカーは停止し、残りのワーカーが処理を続ける。
+    tracksはジェネレータでもよく、キューの長さはworkers * 4までに制限する。
+    tracksの取得中の例外はワーカーを止めてから送出する。稼働中のワーカーがなくなり
+    未処理のトラックが残った場合も例外を送出する（途中までの結果を完了扱いにしない）。
+
+    戻り値は [(track, handlerの戻り値), ...]。
+    """
+    workers = max(1, workers)
+    task_queue = queue.Queue(maxsize=workers * 4)
+    results = {}
+    owned = []
+    state_lock = threading.Lock()
+    alive_workers = [workers]
+    presets = list(initial_browsers)[:workers]
+
+    def new_browser():
+        browser = browser_factory()
+        with state_lock:
+            owned.append(browser)
+        return browser
+
+    def worker(worker_id):
+        browser = presets[worker_id] if worker_id < len(presets) else None
+        restarts = 0
+        try:
+            while True:
+                item = task_queue.get()
+                if item is None:
+                    break
+                index, track = item
+                result = False
+                for attempt in range(2):
+                    if browser is None or not _browser_is_alive(browser):
+                        if browser is not None:
+                            _quit_browser(browser)
+                            restarts += 1
+                            if restarts > max_restarts:
+                                raise Exception("ブラウザの再起動回数が上限に達しました")
+                            logging.warning(f"ワーカー{worker_id}: ブラウザが応答しません。再起動します ({restarts}/{max_restarts})")
+                        browser = new_browser()
+                    logging.info(f"ワーカー{worker_id}: トラック {index+1} を処理中: {track['artist']} - {track['name']}")
+                    result = handler(browser, track)
+                    if result or _browser_is_alive(browser):
+                        break
+                results[index] = result
+        except Exception as e:
+            logging.error(f"ワーカー{worker_id}を停止します: {str(e)}")
+        finally:
+            with state_lock:
+                alive_workers[0] -= 1
+
+    threads = [threading.Thread(target=worker, args=(i,), daemon=True) for i in range(workers)]
+    for thread in threads:
+        thread.start()
+    
+    processed = []
+    try:
+        for index, track in enumerate(tracks):
+            processed.append(track)
+            while True:
+                if alive_workers[0] <= 0:
+                    raise Exception("稼働中のワーカーがありません")
+                try:
+                    task_queue.put((index, track), timeout=1)
+                    break
+                except queue.Full:
+                    continue
+    except Exception as e:
+        logging.error(f"ワーカープールへのトラック投入を中断しました: {str(e)}")
+        raise
+    finally:
+        for _ in threads:
+            while any(thread.is_alive() for thread in threads):
+                try:
+                    task_queue.put(None, timeout=1)
+                    break
+                except queue.Full:
+                    continue
+        for thread in threads:
+            thread.join()
+        for browser in owned:
+            _quit_browser(browser)
+    
+    if len(results) < len(processed):
+        raise Exception(f"稼働中のワーカーがなくなったため、{len(processed) - len(results)}曲を処理できませんでした")
+    return [(track, results[index]) for index, track in enumerate(processed)]
+
+# 同期ジャーナル（途中で失敗した同期を再開するための追記専用ログ）
+# 1行1レコードの空白区切り:
+#   P <プレイリストURL>                         同期先プレイリスト
+#   R <位置> <Qobuz ID> <キー>                    第1段階でIDが決まったトラック（未追加）
+#   T <位置> <結果 ok|ng> <Qobuz ID または -> <キー>  トラックごとの結果
+#   E                                           同期完了
+SYNC_JOURNAL_FILE = "qobuz_sync_journal.log"
+
+class SyncJournal:
+    """同期の進捗を追記するジャーナル（fsyncは一定件数・一定時間ごとにまとめて行う）"""
+
+    def __init__(self, path=SYNC_JOURNAL_FILE, append=False, fsync_every=20, fsync_interval=2.0):
+        self.path = path
+        self.fsync_every = fsync_every
+        self.fsync_interval = fsync_interval
+        torn = False
+        if append and os.path.exists(path) and os.path.getsize(path) > 0:
+            with open(path, "rb") as f:
+                f.seek(-1, os.SEEK_END)
+                torn = f.read(1) != b"\n"
+        self._file = open(path, "a" if append else "w", encoding="utf-8")
+        if torn:
+            # 書き込み途中で途切れた行を閉じてから追記する
+            self._file.write("\n")
+        self._pending = 0
+        self._last_sync = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _write(self, line, force_sync=False):
+        with self._lock:
+            self._file.write(line + "\n")
+            self._pending += 1
+            now = time.monotonic()
+            if force_sync or self._pending >= self.fsync_every or now - self._last_sync >= self.fsync_interval:
+                self._sync(now)
+
+    def _sync(self, now=None):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._pending = 0
+        self._last_sync = now or time.monotonic()
+
+    def record_playlist(self, playlist_url):
+        self._write(f"P {playlist_url}", force_sync=True)
+
+    def record_resolved(self, position, key, qobuz_id):
+        self._write(f"R {position} {qobuz_id} {key}")
+
+    def record_track(self, position, key, added, qobuz_id=None):
+        self._write(f"T {position} {'ok' if added else 'ng'} {qobuz_id or '-'} {key}")
+
+    def record_complete(self):
+        self._write("E", force_sync=True)
+
+    def close(self):
+        with self._lock:
+            if not self._file.closed:
+                self._sync()
+                self._file.close()
+
+def replay_sync_journal(path=SYNC_JOURNAL_FILE):
+    """ジャーナルを読み込み、前回の同期先と処理済みトラックを返す
+
+    戻り値は {'playlist_url', 'processed': {位置: (キー, 成功したか, Qobuz ID)},
+    'resolved': {位置: (キー, Qobuz ID)}, 'complete'}。resolvedはIDが決まったが追加の結果が
+    記録されていないトラック。同じ位置のレコードは後のものを優先する。
+    書き込み途中で途切れた最終行は無視する。ジャーナルがない場合はNone。
+    """
+    if not os.path.exists(path):
+        return None
+    state = {'playlist_url': None, 'processed': {}, 'resolved': {}, 'complete': False}
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.endswith("\n"):
+                break
+            parts = line.split()
+            if not parts:
+                continue
+            if parts[0] == "P" and len(parts) == 2:
+                state['playlist_url'] = parts[1]
+            elif parts[0] == "R" and len(parts) == 4:
+                state['processed'].pop(int(parts[1]), None)
+                state['resolved'][int(parts[1])] = (parts[3], parts[2])
+            elif parts[0] == "T" and len(parts) == 5:
+                qobuz_id = None if parts[3] == "-" else parts[3]
+                state['resolved'].pop(int(parts[1]), None)
+                state['processed'][int(parts[1])] = (parts[4], parts[2] == "ok", qobuz_id)
+            elif parts[0] == "E":
+                state['complete'] = True
+    return state
+
+# SpotifyからQobuzへの同期メイン関数
+def _find_track_paced(browser, track, match_cache=None, search_backend=None, on_result=None):
+    """トラックを検索する（検索のペースはバックエンドごとのレート制限が調整する）"""
+    with run_metrics.span("track"):
+        found, _ = find_qobuz_track_with_cache(browser, track, match_cache, search_backend)
+    track['searched'] = True
+    if on_result:
+        on_result(track, found)
+    return found
+
+def find_qobuz_tracks(tracks, browser, browser_factory, match_cache=None, workers=1, search_backend=None,
+                      on_result=None):
+    """第1段階: 全トラックのQobuz IDを決める
+
+    search_backendがあればブラウザを増やさずにスレッドで並列に検索し、
+    なければrun_browser_worker_poolで複数のブラウザに検索させる。
+    on_result(track, IDが決まったか) は各トラックの検索が終わるたびにワーカーのスレッドで呼ばれる。
+    戻り値は [(track, IDが決まったか), ...]（元の順序）。
+    """
+    if not search_backend:
+        return run_browser_worker_pool(
+            tracks,
+            browser_factory=browser_factory,
+            handler=lambda worker_browser, track: _find_track_paced(worker_browser, track, match_cache,
+                                                                    on_result=on_result),
+            workers=workers,
+            initial_browsers=[browser],
+        )
+    
+    workers = max(1, workers)
+    results = []
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for track in tracks:
+            pending.append((track, executor.submit(_find_track_paced, None, track, match_cache, search_backend,
+                                                   on_result)))
+            # 実行待ちはworkers * 4件までに制限する
+            if len(pending) >= workers * 4:
+                track, future = pending.popleft()
+                results.append((track, future.result()))
+        while pending:
+            track, future = pending.popleft()
+            results.append((track, future.result()))
+    return results
+
+@run_metrics.timed()
+def sync_to_qobuz(spotify_tracks, qobuz_email, qobuz_password, match_cache=None, workers=1, max_tracks=None,
+                  search_backend=None, journal=None, resume_state=None, target_playlist=None, remove_missing=False,
+                  session=None, cookie_file=COOKIE_FILE):
+    """SpotifyのトラックをQobuzに同期する改良版
+
+    先に全トラックのQobuz IDを決め（第1段階）、その後まとめてプレイリストに追加する（第2段階）。
+    match_cacheを渡すと、キャッシュにヒットしたトラックは検索ページを開かずに処理する。
+    workersが2以上の場合は並列に検索する。
+    max_tracksを指定すると先頭からその曲数だけを処理する（Noneで全曲）。
+    search_backendを渡すと検索はそのバックエンドで行い、ブラウザはログインとプレイリスト作成だけに使う。
+    journalを渡すと同期先と各トラックの結果を逐次記録する（第1段階で決まったIDと、第2段階の
+    追加結果）。resume_state（replay_sync_journalの戻り値）を渡すと、前回のプレイリストに対して
+    未処理のトラックから再開する。IDが決まっていたトラックは検索せずに追加だけを行う。
+    target_playlist（名前またはID）を指定すると、新しいプレイリストを作らずにそのプレイリストへ
+    足りないトラックだけを追加する（なければその名前で作成）。remove_missingを指定すると
+    Spotify側にないトラックを削除する。
+    session（ログイン済みのブラウザ）を渡すとそれを使い、終了時に閉じない。
+    """
+    logging.info("Qobuz同期を開始します")
+    
+    processed = (resume_state or {}).get('processed', {})
+    resolved = (resume_state or {}).get('resolved', {})
+    browser = session
+    client, owns_client = None, False
+    try:
+        if browser is None:
+            browser = start_qobuz_session(qobuz_email, qobuz_password, cookie_file)
+        client, owns_client = create_playlist_client(search_backend, cookie_file)
+        if client is None:
+            # ブラウザでの追加は未実装のため、検索を始める前に中止する
+            raise Exception("プレイリストへの追加にはQOBUZ_APP_IDと認証トークンが必要です")
         
-        # プレイリスト作成（日付を含めた名前で）
-        import datetime
-        today = datetime.datetime.now().strftime("%Y-%m-%d")
-        playlist_name = f"Spotify Sync {today}"
-        logging.info(f"新しいプレイリストを作成します: {playlist_name}")
+        def reauthenticate():
+            # ブラウザで再ログインし、保存し直したCookieのトークンをAPIクライアントに反映する
+            if not check_login_status(browser):
+                login_to_qobuz(browser, qobuz_email, qobuz_password)
+            save_cookies(browser, cookie_file)
+            token = load_qobuz_auth_token(cookie_file)
+            for api in (client, search_backend):
+                if isinstance(api, QobuzApiSearchBackend) and token:
+                    api.set_auth_token(token)
+        retry_engine.reauthenticate = reauthenticate
         
-        playlist_url = create_qobuz_playlist(browser, playlist_name)
+        playlist_url = (resume_state or {}).get('playlist_url')
+        if playlist_url:
+            logging.info(f"前回のプレイリストで同期を再開します: {playlist_url} (処理済み {len(processed)}曲)")
+        elif target_playlist:
+            try:
+                playlist_url = find_qobuz_playlist(browser, target_playlist, client)
+            except CircuitOpenError:
+                raise
+            except Exception as e:
+                raise Exception(f"既存のプレイリストを確認できないため中止します: {str(e)}")
+            if playlist_url:
+                logging.info(f"既存のプレイリストに反映します: {playlist_url}")
+            else:
+                logging.info(f"プレイリストが見つからないため作成します: {target_playlist}")
+                playlist_url = create_qobuz_playlist(browser, str(target_playlist))
+        else:
+            # プレイリスト作成（日付を含めた名前で）
+            import datetime
+            today = datetime.datetime.now().strftime("%Y-%m-%d")
+            playlist_name = f"Spotify Sync {today}"
+            logging.info(f"新しいプレイリストを作成します: {playlist_name}")
+            
+            playlist_url = create_qobuz_playlist(browser, playlist_name)
         if not playlist_url:
             raise Exception("プレイリスト作成に失敗しました")
+        if journal:
+            journal.record_playlist(playlist_url)
         
-        # トラックの追加
-        success_count = 0
-        # 初期テストのため、最初の10曲だけを処理
-        max_tracks = 10  # テスト段階では少ない曲数から始める
+        # 既存プレイリストの内容は1回だけ読み込み、以降は索引で照合する
+        index = load_qobuz_playlist_index(browser, playlist_url, client) if target_playlist else None
+        present = []
+        carried = []
+        resumed_ids = []
+        resumed_unresolved = [0]
+        track_count = [0]
         
-        logging.info(f"トラック追加を開始します (最大{max_tracks}曲)")
-        for i, track in enumerate(spotify_tracks[:max_tracks]):
-            # 曲数の制限
-            if success_count >= max_tracks:
-                logging.info("最大曲数に達したため、処理を終了します")
-                break
-                
-            logging.info(f"トラック {i+1}/{min(len(spotify_tracks), max_tracks)} を処理中: {track['artist']} - {track['name']}")
-            if search_and_add_track(browser, track):
-                success_count += 1
-                logging.info(f"トラック追加成功 ({success_count}/{max_tracks})")
-                # トラック追加間の待機（サーバー負荷軽減）
-                wait_time = random.uniform(1.5, 3)
-                logging.info(f"次のトラック処理まで{wait_time:.1f}秒間待機します")
-                time.sleep(wait_time)
-        
-        logging.info(f"Qobuzへの同期が完了しました。{success_count}曲を追加しました")
+        def pending_tracks():
+            # 再開時は同じ位置・同じトラックで処理済みのものを飛ばす
+            for position, track in enumerate(itertools.islice(spotify_tracks, max_tracks)):
+                track_count[0] += 1
+                key = _track_cache_key(track)
+                done = processed.get(position)
+                if done and done[0] == key:
+                    if done[1] and done[2]:
+                        resumed_ids.append(str(done[2]))
+                    elif not done[2]:
+                        resumed_unresolved[0] += 1
+                    continue
+                track['position'] = position
+                # 前回IDが決まったまま追加の結果がないトラックは、検索せずに第2段階へ回す
+                journaled = resolved.get(position)
+                if journaled and journaled[0] == key:
+                    track['qobuz_id'] = journaled[1]
+                    track['searched'] = True
+                    track['match_tier'] = "journal"
+                    carried.append(track)
+                    continue
+                # アーティスト+曲名で既存のトラックと一致すれば検索しない
+                entry = index.find(track) if index else None
+                if entry:
+                    track['qobuz_id'] = str(entry['qobuz_id'])
+                    track['searched'] = True
+                    present.append(track)
+                    if journal:
+                        journal.record_track(position, key, True, track['qobuz_id'])
+                    continue
+                yield track
+        
+        def record_resolved(track, ok):
+            # 見つからなかったトラックはこの時点で結果が確定する
+            if ok:
+                journal.record_resolved(track['position'], _track_cache_key(track), track['qobuz_id'])
+            else:
+                journal.record_track(track['position'], _track_cache_key(track), False)
+        
+        # 第1段階: トラックの検索
+        # spotify_tracksはリストでもジェネレータでもよい（取得中のページを待たずに処理を開始できる）
+        limit_label = f"最大{max_tracks}曲" if max_tracks else "全曲"
+        logging.info(f"トラック検索を開始します ({limit_label}, ワーカー数 {workers})")
+        found = find_qobuz_tracks(
+            pending_tracks(), browser,
+            browser_factory=lambda: start_qobuz_session(qobuz_email, qobuz_password, cookie_file),
+            match_cache=match_cache, workers=workers, search_backend=search_backend,
+            on_result=record_resolved if journal else None,
+        )
+        if retry_engine.circuit_open:
+            raise CircuitOpenError("失敗が続いたため検索を打ち切りました")
+        found = [(track, True) for track in carried] + found
+        
+        # 第2段階: 見つかったトラックのうち、プレイリストにないものだけをまとめて追加
+        to_add = []
+        for track, ok in found:
+            if ok and index and index.find(track):
+                present.append(track)
+                if journal:
+                    journal.record_track(track['position'], _track_cache_key(track), True, track['qobuz_id'])
+            elif ok:
+                to_add.append(track)
+        qobuz_ids = list(dict.fromkeys(track['qobuz_id'] for track in to_add))
+        if index is not None:
+            logging.info(f"既存プレイリストにある曲: {len(present)}曲")
+        logging.info(f"{len(qobuz_ids)}曲をプレイリストに一括追加します")
+        failed_ids = add_tracks_in_batches(browser, playlist_url, qobuz_ids, client=client)
+        results = [(track, ok and track['qobuz_id'] not in failed_ids) for track, ok in found]
+        if qobuz_ids and len(failed_ids) >= len(qobuz_ids):
+            raise Exception(f"見つかった{len(qobuz_ids)}曲をいずれもプレイリストに追加できませんでした")
+        if journal:
+            for track in to_add:
+                journal.record_track(track['position'], _track_cache_key(track),
+                                     track['qobuz_id'] not in failed_ids, track['qobuz_id'])
+        
+        # Spotify側にないトラックの削除（全曲のQobuz IDが決まった場合のみ）
+        all_searched = all(track.get('searched') for track, _ in results)
+        unresolved = sum(1 for _, ok in found if not ok) + resumed_unresolved[0]
+        if remove_missing and index is not None:
+            if max_tracks or not all_searched:
+                logging.warning("一部のトラックしか照合していないため、削除は行いません")
+            elif unresolved:
+                # 見つからなかったトラックに対応する既存の曲を誤って削除しないようにする
+                logging.warning(f"Qobuzで見つからなかったトラックが{unresolved}曲あるため、削除は行いません")
+            elif not track_count[0]:
+                # 取得の失敗で空になった可能性があるので、全曲削除はしない
+                logging.warning("Spotify側のトラックが0曲のため、削除は行いません")
+            else:
+                # 前回の実行で追加済みのトラックも残す
+                keep = {str(track['qobuz_id']) for track in present}
+                keep.update(resumed_ids)
+                keep.update(track['qobuz_id'] for track, added in results if added)
+                stale = [entry for qobuz_id, entry in index.by_id.items() if qobuz_id not in keep]
+                if stale:
+                    logging.info(f"Spotify側にない{len(stale)}曲を削除します")
+                    removed = remove_stale_tracks(browser, playlist_url, stale, client=client)
+                    logging.info(f"{removed}/{len(stale)}曲を削除しました")
+        
+        # ワーカーが停止して未処理のトラックが残った場合は完了を記録しない（次回 --resume で再開）
+        if journal and all_searched:
+            journal.record_complete()
+        success_count = sum(1 for _, added in results if added)
+        tier_counts = {}
+        for track, added in results:
+            if added:
+                tier = track.get('match_tier', 'cache')
+                tier_counts[tier] = tier_counts.get(tier, 0) + 1
+        logging.info(f"一致した検索段階: {tier_counts}")
+        
+        logging.info(f"Qobuzへの同期が完了しました。{success_count}/{len(results)}曲を追加しました")
         return True
         
     except Exception as e:
         logging.error(f"Qobuz同期中にエラーが発生しました: {str(e)}")
         # エラー時のスクリーンショット保存
         if browser:
-            browser.save_screenshot("qobuz_sync_error.png")
+            debug_artifacts.capture_error(browser, "qobuz_sync_error")
+        return False
+    finally:
+        retry_engine.reauthenticate = None
+        if owns_client:
+            client.close()
+        # ブラウザを必ず閉じる（渡されたセッションは呼び出し側が閉じる）
+        if browser and browser is not session:
+            logging.info("ブラウザを終了します")
+            browser.quit()
+
+# ブラウザを使わないマッチングと結果の書き出し（resolve-only）
+MAPPING_EXPORT_FILE = "qobuz_mapping.json"
+MAPPING_FIELDS = ("position", "spotify_id", "artist", "name", "album", "isrc", "status",
+                  "qobuz_id", "confidence", "tier", "spotify_url")
+
+@run_metrics.timed()
+def resolve_only(spotify_tracks, match_cache=None, search_backend=None, workers=1, max_tracks=None):
+    """ブラウザを起動せずにQobuzのトラックIDを決める
+
+    search_backendにはブラウザ不要のバックエンド（APIなど）を渡す。Noneの場合は
+    マッチキャッシュにあるトラックだけを対応付け、残りは未検索として扱う。
+    戻り値はMAPPING_FIELDSをキーに持つ辞書のリスト（Spotify側の順序）。
+    未一致のトラックのconfidenceは、検索した中で最も高かったスコア。
+    """
+    tracks = itertools.islice(spotify_tracks, max_tracks)
+    if search_backend:
+        found = find_qobuz_tracks(tracks, None, None, match_cache=match_cache, workers=workers,
+                                  search_backend=search_backend)
+        if retry_engine.circuit_open:
+            raise CircuitOpenError("失敗が続いたため検索を打ち切りました")
+    else:
+        logging.warning("ブラウザ不要の検索バックエンドがないため、マッチキャッシュだけで対応付けます")
+        found = []
+        for track in tracks:
+            cached = match_cache.get(_track_cache_key(track)) if match_cache else None
+            if cached:
+                track.update(qobuz_id=cached['qobuz_id'], match_confidence=cached['confidence'], match_tier="cache")
+            else:
+                track['match_tier'] = "not_searched"
+            found.append((track, cached is not None))
+    
+    rows = []
+    for position, (track, ok) in enumerate(found):
+        confidence = track.get('match_confidence')
+        rows.append({
+            'position': position,
+            'spotify_id': track.get('id'),
+            'artist': track['artist'],
+            'name': track['name'],
+            'album': track.get('album'),
+            'isrc': track.get('isrc'),
+            'status': "matched" if ok else "unmatched",
+            'qobuz_id': track.get('qobuz_id') if ok else None,
+            'confidence': round(confidence, 4) if confidence is not None else None,
+            'tier': track.get('match_tier') or "no_match",
+            'spotify_url': track.get('url'),
+        })
+    return rows
+
+def write_mapping_export(rows, path=MAPPING_EXPORT_FILE, playlist_id=None):
+    """対応付けの結果を書き出す（拡張子が.csvならCSV、それ以外はJSON）"""
+    matched = [row for row in rows if row['status'] == "matched"]
+    unmatched = [row for row in rows if row['status'] != "matched"]
+    tmp_path = f"{path}.tmp"
+    if path.lower().endswith(".csv"):
+        with open(tmp_path, "w", encoding="utf-8", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=MAPPING_FIELDS)
+            writer.writeheader()
+            writer.writerows(rows)
+    else:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({
+                'generated_at': time.strftime("%Y-%m-%dT%H:%M:%S"),
+                'playlist_id': playlist_id,
+                'summary': {'total': len(rows), 'matched': len(matched), 'unmatched': len(unmatched)},
+                'matched': matched,
+                'unmatched': unmatched,
+            }, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+    logging.info(f"対応付けの結果を保存しました: {path} (一致 {len(matched)}曲, 未一致 {len(unmatched)}曲)")
+
+# 差分同期（スナップショット比較）
+SYNC_STATE_FILE = "qobuz_sync_state.json"
+
+def get_playlist_snapshot_id(sp, playlist_id):
+    """プレイリストのsnapshot_idだけを取得（全トラック取得より軽い）"""
+    return sp.playlist(playlist_id, fields="snapshot_id")['snapshot_id']
+
+def load_sync_state(path=SYNC_STATE_FILE):
+    """前回同期時の状態を読み込む"""
+    try:
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+    except Exception as e:
+        logging.error(f"同期状態の読み込み中にエラー: {str(e)}")
+    return {}
+
+def save_sync_state(state, path=SYNC_STATE_FILE):
+    """同期状態を保存する（一時ファイル経由で置き換える）"""
+    try:
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(state, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
+        logging.info(f"同期状態を保存しました: {path}")
+        return True
+    except Exception as e:
+        logging.error(f"同期状態の保存中にエラー: {str(e)}")
         return False
+
+def _longest_increasing_subsequence(values):
+    """最長増加部分列に含まれる要素のインデックス集合を返す"""
+    tails = []  # 長さごとの末尾の値
+    tails_idx = []
+    prev = [-1] * len(values)
+    for i, value in enumerate(values):
+        pos = bisect.bisect_left(tails, value)
+        if pos == len(tails):
+            tails.append(value)
+            tails_idx.append(i)
+        else:
+            tails[pos] = value
+            tails_idx[pos] = i
+        prev[i] = tails_idx[pos - 1] if pos > 0 else -1
+    result = set()
+    i = tails_idx[-1] if tails_idx else -1
+    while i >= 0:
+        result.add(i)
+        i = prev[i]
+    return result
+
+def compute_playlist_delta(old_keys, new_keys):
+    """前回と今回のトラック列から差分（追加・削除・並べ替え）を求める
+
+    並べ替えは、共通トラックの並びを保ったまま残せる最長部分列以外を
+    「移動が必要なトラック」とすることで移動回数を最小にする。
+    """
+    old_set = set(old_keys)
+    new_set = set(new_keys)
+    added = [(i, key) for i, key in enumerate(new_keys) if key not in old_set]
+    removed = [key for key in old_keys if key not in new_set]
+    
+    old_pos = {key: i for i, key in enumerate(old_keys)}
+    new_pos = {key: i for i, key in enumerate(new_keys)}
+    common = [key for key in new_keys if key in old_set]
+    keep = _longest_increasing_subsequence([old_pos[key] for key in common])
+    moved = [(new_pos[key], key) for i, key in enumerate(common) if i not in keep]
+    
+    return {'added': added, 'removed': removed, 'moved': moved}
+
+def remove_track_from_qobuz_playlist(browser, playlist_url, qobuz_id):
+    """Qobuzプレイリストからトラックを削除"""
+    try:
+        if browser.current_url != playlist_url:
+            browser.get(playlist_url)
+            wait_for_page_ready(browser)
+        
+        # この部分は実際のQobuzのUIに合わせて調整が必要
+        row = WebDriverWait(browser, 10).until(
+            EC.presence_of_element_located((By.XPATH, f"//div[contains(@class, 'track-item') and @data-track-id='{qobuz_id}']"))
+        )
+        remove_button = row.find_element(By.XPATH, ".//button[contains(@class, 'remove')]")
+        remove_button.click()
+        WebDriverWait(browser, 10).until(EC.staleness_of(row))
+        
+        logging.info(f"トラック削除: Qobuz ID {qobuz_id}")
+        return True
+    except Exception as e:
+        logging.error(f"トラック削除エラー: {str(e)}")
+        return False
+
+def move_track_in_qobuz_playlist(browser, playlist_url, qobuz_id, position):
+    """Qobuzプレイリスト内でトラックを指定位置へ移動（ドラッグ＆ドロップ）"""
+    try:
+        if browser.current_url != playlist_url:
+            browser.get(playlist_url)
+            wait_for_page_ready(browser)
+        
+        # この部分は実際のQobuzのUIに合わせて調整が必要
+        rows = browser.find_elements(By.XPATH, "//div[contains(@class, 'track-item')]")
+        source = next((row for row in rows if row.get_attribute("data-track-id") == str(qobuz_id)), None)
+        if source is None or not rows:
+            raise Exception(f"移動元のトラックが見つかりません: {qobuz_id}")
+        target_index = min(position, len(rows) - 1)
+        ActionChains(browser).drag_and_drop(source, rows[target_index]).perform()
+        
+        # 移動先の位置にトラックが表示されるまで待機
+        WebDriverWait(browser, 10).until(
+            lambda driver: driver.find_elements(By.XPATH, "//div[contains(@class, 'track-item')]")[target_index]
+            .get_attribute("data-track-id") == str(qobuz_id)
+        )
+        
+        logging.info(f"トラック移動: Qobuz ID {qobuz_id} → {position + 1}番目")
+        return True
+    except Exception as e:
+        logging.error(f"トラック移動エラー: {str(e)}")
+        return False
+
+def reorder_qobuz_playlist(browser, playlist_url, current, desired, qobuz_ids):
+    """Qobuzプレイリストの並び（current）をdesiredの順序に合わせる
+
+    最長増加部分列に含まれるトラックは動かさず、それ以外を目標順に
+    直前のトラックの後ろへ移動する。戻り値は実際に反映できた並び。
+    """
+    current = list(current)
+    position_of = {key: i for i, key in enumerate(desired)}
+    # 削除できずに残っているトラックは並べ替えの対象外
+    ordered = [key for key in current if key in position_of]
+    keep = _longest_increasing_subsequence([position_of[key] for key in ordered])
+    stay = {key for i, key in enumerate(ordered) if i in keep}
+    for i, key in enumerate(desired):
+        if key in stay:
+            continue
+        rest = [track_key for track_key in current if track_key != key]
+        position = rest.index(desired[i - 1]) + 1 if i > 0 else 0
+        qobuz_id = qobuz_ids.get(key)
+        if qobuz_id and move_track_in_qobuz_playlist(browser, playlist_url, qobuz_id, position):
+            rest.insert(position, key)
+            current = rest
+    return current
+
+def sync_incremental_to_qobuz(spotify_tracks, delta, previous_state, qobuz_email, qobuz_password,
+                              playlist_name="Spotify Sync", match_cache=None, workers=1, search_backend=None):
+    """差分だけを長期運用のQobuzプレイリストに反映する
+
+    戻り値は新しい同期状態の一部（playlist_url, synced, qobuz_ids）。失敗時はNone。
+    追加に失敗したトラックはsyncedに含めず、次回の差分で再試行する。
+    """
+    logging.info(f"差分同期を開始します: 追加 {len(delta['added'])}曲, 削除 {len(delta['removed'])}曲, 移動 {len(delta['moved'])}曲")
+    
+    tracks_by_key = {_track_cache_key(track): track for track in spotify_tracks}
+    qobuz_ids = dict(previous_state.get('qobuz_ids', {}))
+    synced = list(previous_state.get('synced', []))
+    playlist_url = previous_state.get('qobuz_playlist_url')
+    
+    browser = None
+    client, owns_client = None, False
+    try:
+        browser = start_qobuz_session(qobuz_email, qobuz_password)
+        client, owns_client = create_playlist_client(search_backend)
+        if client is None and delta['added']:
+            # ブラウザでの追加は未実装のため、何も変更する前に中止する
+            raise Exception("プレイリストへの追加にはQOBUZ_APP_IDと認証トークンが必要です")
+        
+        # 初回のみプレイリストを作成し、以降は同じプレイリストを使い続ける
+        if not playlist_url:
+            logging.info(f"同期先プレイリストを作成します: {playlist_name}")
+            playlist_url = create_qobuz_playlist(browser, playlist_name)
+            if not playlist_url:
+                raise Exception("プレイリスト作成に失敗しました")
+        
+        # 削除
+        for key in delta['removed']:
+            qobuz_id = qobuz_ids.get(key)
+            if qobuz_id and not remove_track_from_qobuz_playlist(browser, playlist_url, qobuz_id):
+                continue
+            synced.remove(key)
+            qobuz_ids.pop(key, None)
+        
+        # 追加（検索してからまとめて追加する。Qobuz側では末尾に追加される）
+        found = find_qobuz_tracks(
+            [tracks_by_key[key] for _, key in delta['added']], browser,
+            browser_factory=lambda: start_qobuz_session(qobuz_email, qobuz_password),
+            match_cache=match_cache, workers=workers, search_backend=search_backend,
+        )
+        if retry_engine.circuit_open:
+            raise CircuitOpenError("失敗が続いたため検索を打ち切りました")
+        failed_ids = add_tracks_in_batches(browser, playlist_url,
+                                           [track['qobuz_id'] for track, ok in found if ok], client=client)
+        for track, ok in found:
+            if ok and track['qobuz_id'] not in failed_ids:
+                key = _track_cache_key(track)
+                synced.append(key)
+                if track.get('qobuz_id'):
+                    qobuz_ids[key] = track['qobuz_id']
+        
+        # 並べ替え（末尾に追加したトラックと移動したトラックをSpotify側の順序に合わせる）
+        # syncedにはQobuz側で実際に反映できた並びを記録し、移動に失敗した分は次回の差分で再試行する
+        present = set(synced)
+        desired = [key for key in tracks_by_key if key in present]
+        synced = reorder_qobuz_playlist(browser, playlist_url, synced, desired, qobuz_ids)
+        
+        logging.info(f"差分同期が完了しました: 同期済み {len(synced)}/{len(tracks_by_key)}曲")
+        return {'qobuz_playlist_url': playlist_url, 'synced': synced, 'qobuz_ids': qobuz_ids}
+    except Exception as e:
+        logging.error(f"差分同期中にエラーが発生しました: {str(e)}")
+        if browser:
+            debug_artifacts.capture_error(browser, "qobuz_sync_error")
+        return None
     finally:
-        # ブラウザを必ず閉じる
+        if owns_client:
+            client.close()
         if browser:
             logging.info("ブラウザを終了します")
             browser.quit()
 
+@run_metrics.timed()
+def run_incremental_sync(sp, playlist_id, qobuz_email, qobuz_password, state_file=SYNC_STATE_FILE,
+                         match_cache=None, workers=1, search_backend=None):
+    """スナップショットを比較し、変更がある場合だけQobuzに差分を反映する"""
+    state = load_sync_state(state_file)
+    previous = state.get(playlist_id, {})
+    
+    snapshot_id = get_playlist_snapshot_id(sp, playlist_id)
+    synced = previous.get('synced', [])
+    complete = synced == previous.get('tracks', [])
+    if previous.get('snapshot_id') == snapshot_id and previous.get('qobuz_playlist_url') and complete:
+        logging.info(f"プレイリストに変更はありません (snapshot_id: {snapshot_id})。ブラウザを起動せずに終了します")
+        return True
+    
+    tracks = get_playlist_tracks(sp, playlist_id)
+    if tracks is None:
+        # 取得に失敗したまま差分を取ると全曲削除になるため中止する
+        logging.error("Spotifyのトラックを取得できなかったため差分同期を中止します")
+        return False
+    keys = [_track_cache_key(track) for track in tracks]
+    # 同一トラックの重複はSpotify上の最初の出現のみを同期対象とする
+    keys = list(dict.fromkeys(key for key in keys if key))
+    
+    delta = compute_playlist_delta(synced, keys)
+    if not any(delta.values()) and previous.get('qobuz_playlist_url'):
+        logging.info("トラック構成に変更はありません。状態のみ更新します")
+        result = {}
+    else:
+        result = sync_incremental_to_qobuz(tracks, delta, previous, qobuz_email, qobuz_password,
+                                           match_cache=match_cache, workers=workers,
+                                           search_backend=search_backend)
+        if result is None:
+            return False
+    
+    previous.update(result)
+    previous.update({
+        'snapshot_id': snapshot_id,
+        'tracks': keys,
+        'updated_at': time.strftime("%Y-%m-%dT%H:%M:%S"),
+    })
+    state[playlist_id] = previous
+    save_sync_state(state, state_file)
+    return True
+
+# 複数プレイリスト・複数アカウントの同期（設定ファイルで指定）
+# 設定ファイルの例:
+#   {
+#     "accounts": {
+#       "alice": {"email_env": "QOBUZ_EMAIL_ALICE", "password_env": "QOBUZ_PASSWORD_ALICE",
+#                 "requests_per_second": 0.5, "api_requests_per_second": 5}
+#     },
+#     "jobs": [
+#       {"spotify_playlist": "37i9dQZEVXcQ9COmYvdajy", "account": "alice",
+#        "qobuz_playlist": "Discover Weekly", "remove_missing": true}
+#     ]
+#   }
+# パスワードは設定ファイルに書かず、環境変数名で指定する。
+SYNC_CONFIG_FILE = "qobuz_sync_config.json"
+
+def load_sync_config(path=SYNC_CONFIG_FILE):
+    """設定ファイルを読み込み、(アカウント, ジョブ一覧) を返す"""
+    with open(path, "r", encoding="utf-8") as f:
+        config = json.load(f)
+    accounts = config.get('accounts') or {}
+    jobs = config.get('jobs') or []
+    for name, account in accounts.items():
+        suffix = re.sub(r"\W", "_", name).upper()
+        account.setdefault('email_env', f"QOBUZ_EMAIL_{suffix}")
+        account.setdefault('password_env', f"QOBUZ_PASSWORD_{suffix}")
+        account.setdefault('cookie_file', f"qobuz_cookies_{_safe_filename(name)}.json")
+    for job in jobs:
+        if not job.get('spotify_playlist'):
+            raise Exception(f"spotify_playlistが指定されていないジョブがあります: {job}")
+        if job.get('account') not in accounts:
+            raise Exception(f"ジョブのアカウントが設定されていません: {job.get('account')}")
+    return accounts, jobs
+
+def _job_result(account_name, job, success=False, wall_time=0.0):
+    return {
+        'account': account_name,
+        'spotify_playlist': job['spotify_playlist'],
+        'qobuz_playlist': job.get('qobuz_playlist'),
+        'success': success,
+        'wall_time': round(wall_time, 3),
+    }
+
+def run_account_jobs(account_name, account, jobs, options):
+    """1つのアカウントのジョブを順番に処理する（プロセスプールの子プロセスで実行）
+
+    ブラウザはアカウントごとに1つだけ起動し、全ジョブで使い回す。
+    検索のレート制限もアカウントごとに持つ。
+    """
+    global search_rate_limiter, api_rate_limiter, debug_artifacts, retry_engine
+    run_metrics.reset()
+    retry_engine = RetryEngine(failure_threshold=retry_engine.failure_threshold, budget=retry_engine.budget)
+    search_rate_limiter = RateLimiter(rate=float(account.get('requests_per_second', search_rate_limiter.max_rate)))
+    api_rate_limiter = RateLimiter(rate=float(account.get('api_requests_per_second', api_rate_limiter.max_rate)),
+                                   burst=api_rate_limiter.burst)
+    debug_artifacts = DebugArtifacts(directory=os.path.join(debug_artifacts.directory, _safe_filename(account_name)),
+                                     verbose=options.get('verbose', debug_artifacts.verbose))
+    
+    email = os.environ.get(account['email_env'])
+    password = os.environ.get(account['password_env'])
+    cookie_file = account['cookie_file']
+    results = []
+    browser = None
+    match_cache = None
+    search_backend = None
+    try:
+        if not (email and password):
+            raise Exception(f"{account['email_env']}または{account['password_env']}が設定されていません")
+        match_cache = open_match_cache()
+        search_backend = create_search_backend(options.get('search_backend', "selenium"), cookie_file)
+        for job in jobs:
+            started = time.perf_counter()
+            success = False
+            try:
+                if browser is None or not _browser_is_alive(browser):
+                    if browser is not None:
+                        _quit_browser(browser)
+                    browser = start_qobuz_session(email, password, cookie_file)
+                logging.info(f"[{account_name}] ジョブを開始します: {job['spotify_playlist']} → {job.get('qobuz_playlist') or '新規'}")
+                success = sync_to_qobuz(
+                    job['tracks'], email, password, match_cache=match_cache,
+                    workers=options.get('workers', 1), max_tracks=job.get('max_tracks'),
+                    search_backend=search_backend, target_playlist=job.get('qobuz_playlist'),
+                    remove_missing=bool(job.get('remove_missing')), session=browser, cookie_file=cookie_file,
+                )
+            except Exception as e:
+                logging.error(f"[{account_name}] ジョブ実行中にエラー: {str(e)}")
+            results.append(_job_result(account_name, job, success, time.perf_counter() - started))
+            if retry_engine.circuit_open:
+                logging.error(f"[{account_name}] 失敗が続いたため残りのジョブを中止します")
+                break
+    except Exception as e:
+        logging.error(f"[{account_name}] アカウントの処理を中止します: {str(e)}")
+    finally:
+        if browser is not None:
+            _quit_browser(browser)
+        if match_cache:
+            match_cache.close()
+        if search_backend:
+            search_backend.close()
+        debug_artifacts.close()
+    
+    # 実行できなかったジョブも失敗として返す
+    results.extend(_job_result(account_name, job) for job in jobs[len(results):])
+    return {'jobs': results, 'metrics': run_metrics.report()}
+
+@run_metrics.timed()
+def run_scheduled_sync(sp, config_path, options=None, processes=None, fetch_workers=4):
+    """設定ファイルの全ジョブを同期する
+
+    Spotify側は全プレイリストを並行して取得し、アカウントごとに1つの子プロセスで
+    Qobuz側を処理する。同じアカウントのジョブは同じプロセスで順番に実行されるので、
+    全体の所要時間はプレイリスト数ではなくアカウント数に応じて決まる。
+    あるアカウントのプレイリストがすべて取得できた時点で、そのアカウントの処理を開始する。
+    取得に失敗したプレイリストのジョブは実行せず、失敗として記録する。
+    子プロセスは取得用のスレッドが動いている間に起動するため、forkではなくspawnで起動する
+    （コマンドライン引数で変えた設定はoptionsで渡す）。
+    戻り値は {'jobs': 各ジョブの結果, 'accounts': アカウントごとの集計}。
+    """
+    options = options or {}
+    accounts, jobs = load_sync_config(config_path)
+    jobs_by_account = {}
+    for job in jobs:
+        jobs_by_account.setdefault(job['account'], []).append(job)
+    logging.info(f"{len(jobs)}件のジョブを{len(jobs_by_account)}アカウントで同期します")
+    
+    playlist_ids = list(dict.fromkeys(job['spotify_playlist'] for job in jobs))
+    waiting = {name: {job['spotify_playlist'] for job in account_jobs} for name, account_jobs in jobs_by_account.items()}
+    tracks_by_playlist = {}
+    results = []
+    account_metrics = {}
+    
+    with ThreadPoolExecutor(max_workers=fetch_workers) as fetcher, \
+            ProcessPoolExecutor(max_workers=processes or max(1, len(jobs_by_account)),
+                                mp_context=multiprocessing.get_context("spawn")) as pool:
+        fetches = {fetcher.submit(get_playlist_tracks, sp, playlist_id): playlist_id for playlist_id in playlist_ids}
+        account_futures = {}
+        for future in as_completed(fetches):
+            playlist_id = fetches[future]
+            try:
+                tracks_by_playlist[playlist_id] = future.result()
+            except Exception as e:
+                logging.error(f"プレイリストトラック取得エラー: {playlist_id}: {str(e)}")
+                tracks_by_playlist[playlist_id] = None
+            if tracks_by_playlist[playlist_id] is None:
+                logging.error(f"プレイリスト {playlist_id} を取得できなかったため、このプレイリストのジョブは実行しません")
+            
+            for name in [name for name, pending in waiting.items() if playlist_id in pending]:
+                waiting[name].discard(playlist_id)
+                if waiting[name]:
+                    continue
+                del waiting[name]
+                runnable = []
+                for job in jobs_by_account[name]:
+                    tracks = tracks_by_playlist[job['spotify_playlist']]
+                    if tracks is None:
+                        results.append(_job_result(name, job))
+                    else:
+                        runnable.append({**job, 'tracks': tracks})
+                if runnable:
+                    account_futures[pool.submit(run_account_jobs, name, accounts[name], runnable, options)] = name
+        
+        for future in as_completed(account_futures):
+            name = account_futures[future]
+            try:
+                outcome = future.result()
+                results.extend(outcome['jobs'])
+                account_metrics[name] = outcome['metrics']
+            except Exception as e:
+                logging.error(f"[{name}] アカウントのプロセスが異常終了しました: {str(e)}")
+                results.extend(_job_result(name, job) for job in jobs_by_account[name]
+                               if tracks_by_playlist.get(job['spotify_playlist']) is not None)
+    
+    success_count = sum(1 for result in results if result['success'])
+    logging.info(f"全ジョブの同期が完了しました: {success_count}/{len(results)}件成功")
+    return {'jobs': results, 'accounts': account_metrics}
+
+# コマンドライン引数
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="SpotifyのプレイリストをQobuzに同期します")
+    parser.add_argument("--config", default=os.environ.get("QOBUZ_SYNC_CONFIG"),
+                        help="複数のプレイリスト・アカウントをまとめて同期する設定ファイル（JSON）")
+    parser.add_argument("--processes", type=int, default=int(os.environ.get("QOBUZ_PROCESSES") or "0") or None,
+                        help="--config 指定時に並列で動かすプロセス数（省略時はアカウント数）")
+    parser.add_argument("--resolve-only", action="store_true", default=_env_flag("QOBUZ_RESOLVE_ONLY"),
+                        help="ブラウザを起動せずにマッチングだけを行い、結果を --export に書き出す")
+    parser.add_argument("--export", default=os.environ.get("QOBUZ_MAPPING_EXPORT", MAPPING_EXPORT_FILE),
+                        help="--resolve-only の出力先（.csvならCSV、それ以外はJSON）")
+    parser.add_argument("--incremental", action="store_true",
+                        default=os.environ.get("SYNC_MODE") == "incremental",
+                        help="前回からの差分だけを同じQobuzプレイリストに反映する（環境変数 SYNC_MODE=incremental でも指定可）")
+    parser.add_argument("--state-file", default=os.environ.get("SYNC_STATE_FILE", SYNC_STATE_FILE),
+                        help="差分同期の状態ファイル")
+    parser.add_argument("--workers", type=int, default=int(os.environ.get("QOBUZ_WORKERS") or "1"),
+                        help="並列に動かすブラウザの数（環境変数 QOBUZ_WORKERS でも指定可）")
+    parser.add_argument("--search-backend", choices=["selenium", "api"],
+                        default=os.environ.get("QOBUZ_SEARCH_BACKEND") or "selenium",
+                        help="トラック検索の方法（api はQobuzのJSON検索APIを使い、QOBUZ_APP_IDが必要）")
+    parser.add_argument("--max-tracks", type=int, default=int(os.environ.get("QOBUZ_MAX_TRACKS") or "0") or None,
+                        help="処理する最大曲数（省略時は全曲）")
+    parser.add_argument("--report", default=os.environ.get("RUN_REPORT_FILE", RUN_REPORT_FILE),
+                        help="フェーズごとの処理時間をまとめたJSONレポートの出力先")
+    parser.add_argument("--warm-start", action="store_true", default=_env_flag("QOBUZ_WARM_START"),
+                        help="再利用プロファイル・キャッシュ済みドライバーでブラウザを起動する（QOBUZ_WARM_START=1 でも指定可）")
+    parser.add_argument("--lean", action="store_true", default=_env_flag("QOBUZ_LEAN_BROWSER"),
+                        help="画像・フォント・メディア・計測タグを読み込まない軽量ブラウザを使う（QOBUZ_LEAN_BROWSER=1 でも指定可）")
+    parser.add_argument("--verbose", action="store_true", default=_env_flag("QOBUZ_DEBUG_VERBOSE"),
+                        help="処理の区切りごとにスクリーンショットを書き出す（通常はエラー時のみ）")
+    parser.add_argument("--playlist", default=os.environ.get("QOBUZ_TARGET_PLAYLIST"),
+                        help="同期先の既存プレイリスト（名前またはID）。足りないトラックだけを追加する")
+    parser.add_argument("--remove-missing", action="store_true", default=_env_flag("QOBUZ_REMOVE_MISSING"),
+                        help="--playlist 指定時、Spotify側にないトラックを削除する")
+    parser.add_argument("--resume", action="store_true",
+                        help="前回途中で終わった同期をジャーナルから再開する")
+    parser.add_argument("--journal", default=os.environ.get("SYNC_JOURNAL_FILE", SYNC_JOURNAL_FILE),
+                        help="同期ジャーナルのファイル")
+    return parser.parse_args(argv)
+
 # メイン処理
 if __name__ == "__main__":
+    args = parse_args()
+    # ワーカーのブラウザもsetup_browserで同じ設定を参照する
+    if args.warm_start:
+        os.environ["QOBUZ_WARM_START"] = "1"
+    if args.lean:
+        os.environ["QOBUZ_LEAN_BROWSER"] = "1"
+    debug_artifacts.verbose = args.verbose
+    report_extra = None
     try:
         logging.info("スクリプト実行を開始します")
         
@@ -464,6 +2986,19 @@ if __name__ == "__main__":
             logging.error("Spotify認証に失敗しました")
             exit(1)
         
+        # 設定ファイルによる複数プレイリスト・複数アカウントの同期
+        if args.config:
+            report_extra = run_scheduled_sync(sp, args.config, options={
+                'workers': args.workers,
+                'search_backend': args.search_backend,
+                'verbose': args.verbose,
+            }, processes=args.processes)
+            if not all(result['success'] for result in report_extra['jobs']):
+                logging.error("一部のジョブが失敗しました")
+                exit(1)
+            logging.info("全ての処理が完了しました")
+            exit(0)
+        
         # プレイリストID取得（後方互換性のため両方の環境変数をサポート）
         playlist_id = os.environ.get("COMBINED_PLAYLIST_ID") or os.environ.get("DISCOVER_WEEKLY_ID")
         if not playlist_id:
@@ -471,14 +3006,65 @@ if __name__ == "__main__":
             exit(1)
         
         logging.info(f"使用するプレイリストID: {playlist_id}")
+        
+        # マッチングだけを行うモード（Qobuzの認証情報とブラウザは不要）
+        if args.resolve_only:
+            logging.info("ブラウザを使わずにマッチングだけを行います")
+            match_cache = open_match_cache()
+            search_backend = create_search_backend("api")
+            try:
+                rows = resolve_only(iter_playlist_tracks(sp, playlist_id), match_cache=match_cache,
+                                    search_backend=search_backend, workers=args.workers,
+                                    max_tracks=args.max_tracks)
+                write_mapping_export(rows, args.export, playlist_id=playlist_id)
+            finally:
+                if match_cache:
+                    match_cache.close()
+                if search_backend:
+                    search_backend.close()
+            logging.info("全ての処理が完了しました")
+            exit(0)
+        
+        # 差分同期モード
+        if args.incremental:
+            qobuz_email = os.environ.get("QOBUZ_EMAIL")
+            qobuz_password = os.environ.get("QOBUZ_PASSWORD")
+            if not (qobuz_email and qobuz_password):
+                logging.error("QobuzのログインIDまたはパスワードが設定されていません")
+                exit(1)
+            
+            logging.info("差分同期モードで実行します")
+            match_cache = open_match_cache()
+            search_backend = create_search_backend(args.search_backend)
+            try:
+                sync_result = run_incremental_sync(sp, playlist_id, qobuz_email, qobuz_password,
+                                                   state_file=args.state_file, match_cache=match_cache,
+                                                   workers=args.workers, search_backend=search_backend)
+            finally:
+                if match_cache:
+                    match_cache.close()
+                if search_backend:
+                    search_backend.close()
+            if not sync_result:
+                logging.error("差分同期に失敗しました")
+                exit(1)
+            logging.info("全ての処理が完了しました")
+            exit(0)
+        
         logging.info("統合プレイリストの同期を開始します")
         
-        # トラック情報取得
-        tracks = get_playlist_tracks(sp, playlist_id)
+        # トラック情報取得（ページ単位で逐次取得し、最初のページからQobuz同期を開始する）
+        try:
+            track_stream = iter_playlist_tracks(sp, playlist_id)
+            first_track = next(track_stream, None)
+        except Exception as e:
+            logging.error(f"プレイリストトラック取得エラー: {str(e)}")
+            exit(1)
         
         # Qobuz同期
-        if tracks:
-            logging.info(f"トラック取得成功: {len(tracks)}曲")
+        if first_track:
+            logging.info("トラック取得成功: 残りのページはバックグラウンドで取得します")
+            tracks = itertools.chain([first_track], track_stream)
             
             # Qobuz同期を有効化
             qobuz_email = os.environ.get("QOBUZ_EMAIL")
@@ -486,13 +3072,39 @@ if __name__ == "__main__":
             
             if qobuz_email and qobuz_password:
                 logging.info("Qobuz認証情報が見つかりました。同期を開始します。")
-                sync_result = sync_to_qobuz(tracks, qobuz_email, qobuz_password)
-                if sync_result:
-                    logging.info("Qobuz同期が成功しました")
-                else:
+                # 再開モードではジャーナルから前回の同期先と処理済みトラックを読み込む
+                resume_state = replay_sync_journal(args.journal) if args.resume else None
+                if args.resume and not resume_state:
+                    logging.info("再開できるジャーナルがありません。新しく同期を開始します")
+                if resume_state and resume_state['complete']:
+                    logging.info("前回の同期は完了しています。再開する処理はありません")
+                    exit(0)
+                
+                match_cache = open_match_cache()
+                search_backend = create_search_backend(args.search_backend)
+                journal = SyncJournal(args.journal, append=bool(resume_state))
+                try:
+                    sync_result = sync_to_qobuz(tracks, qobuz_email, qobuz_password, match_cache=match_cache,
+                                                workers=args.workers, max_tracks=args.max_tracks,
+                                                search_backend=search_backend, journal=journal,
+                                                resume_state=resume_state, target_playlist=args.playlist,
+                                                remove_missing=args.remove_missing)
+                finally:
+                    journal.close()
+                    if match_cache:
+                        match_cache.close()
+                    if search_backend:
+                        search_backend.close()
+                if retry_engine.circuit_open:
+                    logging.error("失敗が続いたため同期を中止しました（--resume で再開できます）")
+                    exit(1)
+                if not sync_result:
                     logging.error("Qobuz同期に失敗しました")
+                    exit(1)
+                logging.info("Qobuz同期が成功しました")
             else:
                 logging.error("QobuzのログインIDまたはパスワードが設定されていません")
+                exit(1)
         else:
             logging.error("同期するトラックが見つかりませんでした")
         
@@ -500,3 +3112,6 @@ if __name__ == "__main__":
     except Exception as e:
         logging.error(f"予期せぬエラーが発生しました: {str(e)}")
         exit(1)
+    finally:
+        debug_artifacts.close()
+        run_metrics.write_report(args.report, extra=report_extra)